@@ -1,14 +1,19 @@
-import urllib
 import json
+import os
+import sys
 import requests
 import pandas as pd
 import psycopg2
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import http_client
+
 try:
     # Load database and API configuration from a JSON file
     with open('config.json') as config_file:
         config = json.load(config_file)
+    http_client.configure(config)
         
     # Extract configuration parameters
     client_id = config['client_id']
@@ -36,8 +41,9 @@ try:
             continue
             
         # Fetch weather data from the Aeris Weather API
-        request = urllib.request.urlopen(f'https://api.aerisapi.com/conditions/{latitude},{longitude}?format=json&plimit=1&filter=1min&client_id={client_id}&client_secret={client_secret}')
-        response = request.read()
+        request = http_client.get(f'https://api.aerisapi.com/conditions/{latitude},{longitude}?format=json&plimit=1&filter=1min&client_id={client_id}&client_secret={client_secret}', provider='aerisweather')
+        request.raise_for_status()
+        response = request.content
 
         # Check if response is empty
         if response:
@@ -47,7 +53,6 @@ try:
             
             # Parse the JSON response
             data = json.loads(response)
-            request.close()
             
             # Pretty print the JSON data
             pretty_json = json.dumps(data, indent=4)
@@ -69,12 +74,12 @@ except psycopg2.OperationalError as e:
     print(f"Error connecting to the PostgreSQL database: {e}")
 
 # Handle HTTP errors
-except urllib.error.HTTPError as e:
-    print(f"HTTP Error: {e.code} - {e.reason}")
+except requests.exceptions.HTTPError as e:
+    print(f"HTTP Error: {e.response.status_code} - {e.response.reason}")
 
-# Handle URL errors
-except urllib.error.URLError as e:
-    print(f"URL Error: {e.reason}")
+# Handle connection errors and timeouts
+except requests.exceptions.RequestException as e:
+    print(f"Request Error: {e}")
 
 # Handle JSON decoding errors
 except json.JSONDecodeError as e:
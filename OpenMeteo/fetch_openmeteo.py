@@ -1,10 +1,14 @@
 import openmeteo_requests
-import requests_cache
 import pandas as pd
 from retry_requests import retry
 import matplotlib.pyplot as plt
 import psycopg2
 import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import http_client
 
 try:
     # Load config from config.json
@@ -16,9 +20,9 @@ try:
     password = config['password']
     host = config['host']
     
-    # Setup the Open-Meteo API client with cache and retry on error
-    cache_session = requests_cache.CachedSession('.cache', expire_after=-1)
-    retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
+    # Setup the Open-Meteo API client with the shared cache and retry on error
+    http_client.configure(config)
+    retry_session = retry(http_client.get_session(), retries=5, backoff_factor=0.2)
     openmeteo = openmeteo_requests.Client(session=retry_session)
     
     # Connect to PostgreSQL database
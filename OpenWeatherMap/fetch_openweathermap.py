@@ -2,6 +2,11 @@ import psycopg2
 import requests
 from datetime import datetime
 import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import http_client
 
 def call_weather_api(lat, lon, api_key):
     """
@@ -18,7 +23,7 @@ def call_weather_api(lat, lon, api_key):
     
     url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
     try:
-        response = requests.get(url)
+        response = http_client.get(url, provider='openweathermap')
         response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
         data = response.json()
         return data
@@ -79,6 +84,7 @@ def main():
     config = load_config()
 
     if config:
+        http_client.configure(config)
         api_key = config["api_key"]
         db_config = {
             "dbname": config["dbname"],
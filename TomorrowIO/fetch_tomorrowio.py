@@ -1,8 +1,13 @@
 import requests
 import json
+import os
+import sys
 import psycopg2
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import http_client
+
 def get_weather_forecast(latitude, longitude, config):
     """
     Function to fetch weather forecast data from Tomorrow.io API.
@@ -20,7 +25,7 @@ def get_weather_forecast(latitude, longitude, config):
     url = f'https://api.tomorrow.io/v4/weather/realtime?location={latitude},{longitude}&apikey={api_key}'
     
     try:
-        response = requests.get(url)
+        response = http_client.get(url, provider='tomorrowio')
         response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
         
         if response.status_code == 200:
@@ -73,6 +78,7 @@ if __name__ == "__main__":
     try:
         with open('config.json') as config_file:
             config = json.load(config_file) # Loading configuration from JSON file
+        http_client.configure(config)
         
         connection = psycopg2.connect(
             dbname=config['dbname'],
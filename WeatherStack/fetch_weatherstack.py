@@ -3,6 +3,11 @@ import pandas as pd
 from datetime import datetime
 import psycopg2
 import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import http_client
 
 def load_config(filename):
     """
@@ -88,7 +93,7 @@ def call_weather_api(params, config):
     """
     try:
         # Make a GET request to the weather API using provided parameters
-        api_result = requests.get(config['request_url'], params)
+        api_result = http_client.get(config['request_url'], params, provider='weatherstack')
         # Raise an exception for 4xx and 5xx status codes
         api_result.raise_for_status()
         # Parse the JSON response
@@ -145,6 +150,7 @@ def main():
     config = load_config('config.json')
     if config is None:
         return
+    http_client.configure(config)
         
     # Connect to the PostgreSQL database
     connection = connect_to_database(config)
@@ -1,8 +1,13 @@
 import json
+import os
+import sys
 import psycopg2
 import requests
 from datetime import datetime
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import http_client
+
 def load_config(filename):
     """
     Load configuration settings from a JSON file.
@@ -83,7 +88,7 @@ def get_weather_data(api_key, latitude, longitude):
     
     try:
         url = f"https://api.weatherbit.io/v2.0/current?lat={latitude}&lon={longitude}&key={api_key}"
-        response = requests.get(url)
+        response = http_client.get(url, provider='weatherbit')
         response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
 
         if response.status_code == 200:
@@ -132,6 +137,7 @@ def main():
     config = load_config('config.json')
         
     if config:
+        http_client.configure(config)
         api_key = config['api_key']
         
         connection = connect_to_database(config)
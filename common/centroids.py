@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+class CentroidIndex:
+    """
+    Mean coordinates of the known stops per town and per town part.
+
+    Built from the stops that have coordinates, it gives an approximate
+    position for a stop without coordinates: the centroid of its town part
+    ('Cast obce') if that part has known stops, otherwise the centroid of
+    its town ('Obec').
+    """
+
+    def __init__(self, df, latitude, longitude, town, town_part):
+        """
+        Args:
+            df (pd.DataFrame): Stops, coordinates (0, 0) mean unknown.
+            latitude (str): Name of the latitude column.
+            longitude (str): Name of the longitude column.
+            town (str): Name of the town column.
+            town_part (str): Name of the town part column.
+        """
+
+        known = df[(df[latitude] != 0) | (df[longitude] != 0)]
+        coordinates = [latitude, longitude]
+        self.parts = known[known[town_part] != ''].groupby([town, town_part])[coordinates].mean()
+        self.towns = known.groupby(town)[coordinates].mean()
+
+    def lookup(self, towns, town_parts):
+        """
+        Get the centroids for many stops at once.
+
+        Args:
+            towns (pd.Series): Towns of the stops.
+            town_parts (pd.Series): Town parts of the stops, '' if none.
+
+        Returns:
+            np.ndarray: (latitude, longitude) per stop, NaN where neither the
+            town part nor the town has known stops.
+        """
+
+        parts = pd.MultiIndex.from_arrays([towns.to_numpy(), town_parts.to_numpy()])
+        part_values = self.parts.reindex(parts).to_numpy()
+        town_values = self.towns.reindex(towns.to_numpy()).to_numpy()
+        return np.where(np.isnan(part_values), town_values, part_values)
+
+def fill_missing_coordinates(df, latitude, longitude, town, town_part, rows=None):
+    """
+    Fill missing (0, 0) coordinates from town part and town centroids in place.
+
+    Args:
+        df (pd.DataFrame): Stops.
+        latitude (str): Name of the latitude column.
+        longitude (str): Name of the longitude column.
+        town (str): Name of the town column.
+        town_part (str): Name of the town part column.
+        rows (pd.Series): Boolean mask limiting which stops are filled, all if None.
+
+    Returns:
+        int: Number of stops whose coordinates were filled.
+    """
+
+    missing = (df[latitude] == 0) & (df[longitude] == 0)
+    if rows is not None:
+        missing &= rows
+    if not missing.any():
+        return 0
+
+    index = CentroidIndex(df, latitude, longitude, town, town_part)
+    values = index.lookup(df.loc[missing, town], df.loc[missing, town_part])
+    found = ~np.isnan(values[:, 0])
+    df.loc[df.index[missing][found], [latitude, longitude]] = values[found]
+    return int(found.sum())
@@ -0,0 +1,151 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Weather columns and where they are found in an OpenWeatherMap response,
+# nested keys are separated by dots
+WEATHER_FIELDS = (
+    ('weather', 'weather'),
+    ('main_temp', 'main.temp'),
+    ('main_feels_like', 'main.feels_like'),
+    ('main_temp_min', 'main.temp_min'),
+    ('main_temp_max', 'main.temp_max'),
+    ('main_pressure', 'main.pressure'),
+    ('main_humidity', 'main.humidity'),
+    ('main_sea_level', 'main.sea_level'),
+    ('main_grnd_level', 'main.grnd_level'),
+    ('visibility', 'visibility'),
+    ('wind_speed', 'wind.speed'),
+    ('wind_deg', 'wind.deg'),
+    ('wind_gust', 'wind.gust'),
+    ('clouds_all', 'clouds.all'),
+    ('rain_1h', 'rain.1h'),
+    ('rain_3h', 'rain.3h'),
+    ('snow_1h', 'snow.1h'),
+    ('snow_3h', 'snow.3h'),
+    ('dt', 'dt'),
+    ('sys_sunrise', 'sys.sunrise'),
+    ('sys_sunset', 'sys.sunset'),
+    ('timezone', 'timezone'),
+)
+
+def loads(payload):
+    """
+    Decode a JSON document, with orjson if it is installed.
+
+    Args:
+        payload (bytes or str): JSON document.
+
+    Returns:
+        Decoded value.
+    """
+
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+def dumps(value):
+    """
+    Encode a value as a JSON string, with orjson if it is installed.
+
+    Args:
+        value: Value to encode.
+
+    Returns:
+        str: JSON document.
+    """
+
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value)
+
+class FieldExtractor:
+    """
+    Extract columns from a provider response according to a field spec.
+
+    The spec is compiled once: fields are grouped by their top-level key, so
+    every nested object of the response is looked up only once per row.
+    Missing fields get `default`, missing required fields raise KeyError.
+    Converters are applied to values that are present.
+    """
+
+    def __init__(self, fields, default=None, required=(), converters=None):
+        """
+        Args:
+            fields (tuple): (column, path) pairs such as WEATHER_FIELDS.
+            default: Value of missing fields.
+            required (tuple): Columns that must be present in the response.
+            converters (dict): Functions applied to the value of a column.
+        """
+
+        converters = converters or {}
+        self.columns = tuple(column for column, _ in fields)
+        self.default = default
+        self.top_level = []
+        self.sections = {}
+        for index, (column, path) in enumerate(fields):
+            key, _, subkey = path.partition('.')
+            field = (index, subkey or key, converters.get(column), column in required)
+            if subkey:
+                self.sections.setdefault(key, []).append(field)
+            else:
+                self.top_level.append(field)
+        self.sections = list(self.sections.items())
+
+    def __call__(self, data):
+        """
+        Extract one row.
+
+        Args:
+            data (dict): Decoded provider response.
+
+        Returns:
+            tuple: Values in the order of `columns`.
+
+        Raises:
+            KeyError: If a required field is missing.
+        """
+
+        values = [self.default] * len(self.columns)
+        for index, key, convert, required in self.top_level:
+            value = data[key] if required else data.get(key)
+            if value is not None:
+                values[index] = convert(value) if convert else value
+        for section_key, fields in self.sections:
+            section = data.get(section_key) or {}
+            for index, key, convert, required in fields:
+                value = section[key] if required else section.get(key)
+                if value is not None:
+                    values[index] = convert(value) if convert else value
+        return tuple(values)
+
+    def from_json(self, payload):
+        """
+        Extract one row straight from a raw JSON response.
+
+        Args:
+            payload (bytes or str): Provider response body.
+
+        Returns:
+            tuple: Values in the order of `columns`.
+        """
+
+        return self(loads(payload))
+
+    def to_columns(self, rows):
+        """
+        Transpose extracted rows into columns.
+
+        Args:
+            rows (list): Rows returned by the extractor.
+
+        Returns:
+            dict: List of values per column name.
+        """
+
+        if not rows:
+            return {column: [] for column in self.columns}
+        return {column: list(values) for column, values in zip(self.columns, zip(*rows))}
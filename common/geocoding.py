@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common.rate_limit import TokenBucket
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.geocode_cache.sqlite')
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+USER_AGENT = "bc_weather/1.0 (bus stop weather collector)"
+TIMEOUT = (5, 30)
+
+def place_name(town, stop_name):
+    """
+    Build the Nominatim query of a stop.
+
+    Args:
+        town (str): Town of the stop ('Obec').
+        stop_name (str): Name of the stop ('Nazov zastavky').
+
+    Returns:
+        str: Query in the form 'town, stop name'.
+    """
+
+    return f"{town}, {str(stop_name).replace(',', '.')}"
+
+def normalise(place):
+    """
+    Normalise a place name for use as a cache key.
+
+    Args:
+        place (str): Place name.
+
+    Returns:
+        str: Lower case name with collapsed whitespace.
+    """
+
+    return ' '.join(place.lower().split())
+
+class GeocodeCache:
+    """
+    Persistent SQLite cache of geocoding results.
+
+    Places that could not be found are stored too, with NULL coordinates,
+    so they are not looked up again on the next run.
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        """
+        Args:
+            path (str): Path of the SQLite cache file.
+        """
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS places (
+                place TEXT PRIMARY KEY,
+                latitude REAL,
+                longitude REAL,
+                created INTEGER
+            )
+            """
+        )
+        self.conn.commit()
+
+    def get(self, place):
+        """
+        Look up a place.
+
+        Args:
+            place (str): Normalised place name.
+
+        Returns:
+            tuple: (found, coordinates), found is False if the place was
+            never looked up, coordinates are None for a negative result.
+        """
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT latitude, longitude FROM places WHERE place = ?", (place,)
+            ).fetchone()
+        if row is None:
+            return False, None
+        return True, ((row[0], row[1]) if row[0] is not None else None)
+
+    def put(self, place, coordinates):
+        """
+        Store the result of a lookup.
+
+        Args:
+            place (str): Normalised place name.
+            coordinates (tuple): (latitude, longitude), None if not found.
+        """
+
+        latitude, longitude = coordinates if coordinates is not None else (None, None)
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO places (place, latitude, longitude, created) VALUES (?, ?, ?, ?)",
+                (place, latitude, longitude, int(time.time()))
+            )
+            self.conn.commit()
+
+class Geocoder:
+    """
+    Nominatim geocoder with a persistent cache.
+
+    Lookups run on a bounded pool of threads and share one token bucket, so
+    requests stay within the Nominatim usage policy (one request per second
+    by default). Only places missing from the cache cause a request; failed
+    requests are not cached and are tried again on the next run.
+    """
+
+    def __init__(self, cache_path=DEFAULT_PATH, workers=2, requests_per_second=1):
+        """
+        Args:
+            cache_path (str): Path of the SQLite cache file.
+            workers (int): Maximum number of requests in flight.
+            requests_per_second (float): Request rate limit.
+        """
+
+        self.cache = GeocodeCache(cache_path)
+        self.workers = workers
+        self.bucket = TokenBucket(requests_per_second, 1)
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create a geocoder from the optional 'geocoding' section of a config.
+
+        Args:
+            config (dict): Configuration settings.
+
+        Returns:
+            Geocoder: The geocoder.
+        """
+
+        geocoding = config.get('geocoding', {})
+        return cls(
+            geocoding.get('cache_path', DEFAULT_PATH),
+            geocoding.get('workers', 2),
+            geocoding.get('requests_per_second', 1)
+        )
+
+    def geocode(self, place):
+        """
+        Get the coordinates of a place.
+
+        Args:
+            place (str): Place name, see place_name().
+
+        Returns:
+            tuple: (latitude, longitude), None if the place was not found.
+        """
+
+        key = normalise(place)
+        found, coordinates = self.cache.get(key)
+        if found:
+            return coordinates
+
+        self.bucket.acquire()
+        try:
+            response = self.session.get(NOMINATIM_URL, params={'q': place, 'format': 'json', 'limit': 1}, timeout=TIMEOUT)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"Error retrieving coordinates for '{place}': {e}")
+            sys.stdout.flush()
+            return None
+
+        coordinates = (float(data[0]['lat']), float(data[0]['lon'])) if data else None
+        self.cache.put(key, coordinates)
+        if coordinates is not None:
+            print(f"Fetched missing coordinates for '{place}'")
+        else:
+            print(f"No coordinates found for '{place}'")
+        sys.stdout.flush()
+        return coordinates
+
+    def geocode_many(self, places):
+        """
+        Get the coordinates of many places concurrently.
+
+        Args:
+            places (iterable): Place names, duplicates are looked up once.
+
+        Returns:
+            dict: (latitude, longitude) or None per place name.
+        """
+
+        unique = list(dict.fromkeys(places))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return dict(zip(unique, executor.map(self.geocode, unique)))
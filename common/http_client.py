@@ -0,0 +1,142 @@
+import sys
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+from requests.adapters import HTTPAdapter
+
+from common import rate_limit
+from common.response_cache import CachedSession, ResponseCache, DEFAULT_PATH, DEFAULT_TTLS, MAX_ENTRIES, PRECISION
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+POOL_MAXSIZE = 32
+MAX_RETRIES = 3
+RETRY_AFTER_DEFAULT = 60
+
+_session = None
+_timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+_max_retries = MAX_RETRIES
+
+def configure(config):
+    """
+    Configure the shared HTTP client from the 'http' section of a config file.
+
+    Recognised keys are 'connect_timeout', 'read_timeout' (seconds),
+    'pool_maxsize' (keep-alive connections kept per host) and 'max_retries'
+    (attempts after a 429 response). Missing keys fall back to the module
+    defaults. Provider quotas are loaded from the 'rate_limits' section.
+
+    Responses are cached as set up by the 'cache' section: 'path' of the
+    SQLite file, 'max_entries', coordinate 'precision' of cache keys and
+    'ttl', seconds to live by host or host/path prefix (merged over the
+    defaults in common.response_cache). Set 'enabled' to false to turn the
+    cache off.
+
+    Args:
+        config (dict): Configuration settings.
+    """
+
+    global _session, _timeout, _max_retries
+
+    http_config = config.get('http', {})
+    _timeout = (
+        http_config.get('connect_timeout', CONNECT_TIMEOUT),
+        http_config.get('read_timeout', READ_TIMEOUT)
+    )
+    _max_retries = http_config.get('max_retries', MAX_RETRIES)
+    if _session is not None:
+        _session.close()
+    _session = _create_session(http_config.get('pool_maxsize', POOL_MAXSIZE), config.get('cache', {}))
+    rate_limit.configure(config)
+
+def _create_session(pool_maxsize, cache_config):
+    cache = None
+    if cache_config.get('enabled', True):
+        cache = ResponseCache(cache_config.get('path', DEFAULT_PATH), cache_config.get('max_entries', MAX_ENTRIES))
+    ttls = {**DEFAULT_TTLS, **cache_config.get('ttl', {})}
+    session = CachedSession(cache, ttls, cache_config.get('precision', PRECISION))
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+    return session
+
+def get_session():
+    """
+    Get the shared session, creating it with default settings if needed.
+
+    Returns:
+        CachedSession: Caching session with pooled keep-alive connections.
+    """
+
+    global _session
+
+    if _session is None:
+        _session = _create_session(POOL_MAXSIZE, {})
+    return _session
+
+def retry_after(response):
+    """
+    Get the number of seconds a server asked us to wait.
+
+    Args:
+        response (requests.Response): Response with a Retry-After header.
+
+    Returns:
+        float: Seconds to wait, RETRY_AFTER_DEFAULT if the header is missing.
+    """
+
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return RETRY_AFTER_DEFAULT
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return RETRY_AFTER_DEFAULT
+
+def get(url, params=None, headers=None, provider=None):
+    """
+    Send a GET request over the shared pooled session.
+
+    Cached responses are returned without touching the network or the rate
+    limit. When a provider is given, the request waits for its rate limit. A 429
+    response (or a 503 with Retry-After) pauses the provider for the time the
+    server asked for and the request is retried, up to 'max_retries' times.
+
+    Args:
+        url (str): URL to request.
+        params (dict): Query string parameters.
+        headers (dict): Additional request headers.
+        provider (str): Provider name used for rate limiting.
+
+    Returns:
+        requests.Response: Response of the last attempt.
+
+    Raises:
+        requests.exceptions.RequestException: If the request fails or times out.
+    """
+
+    session = get_session()
+    cached = session.lookup(url, params)
+    if cached is not None:
+        return cached
+
+    for attempt in range(_max_retries + 1):
+        rate_limit.acquire(provider)
+        response = session.get(url, params=params, headers=headers, timeout=_timeout)
+
+        throttled = response.status_code == 429 or (
+            response.status_code == 503 and 'Retry-After' in response.headers)
+        if not throttled or attempt == _max_retries:
+            return response
+
+        wait = retry_after(response)
+        print(f"Rate limited by {provider or url}, retrying in {wait:.0f}s")
+        sys.stdout.flush()
+        if not rate_limit.pause(provider, wait):
+            time.sleep(wait)
@@ -0,0 +1,155 @@
+import queue
+import sys
+import threading
+import time
+
+_DONE = object()
+
+class Stage:
+    """
+    One step of a Pipeline, run by its own pool of worker threads.
+
+    The stage function takes one item and returns the item for the next
+    stage, or None to drop it. Items returned by the last stage are
+    discarded, so the last stage is where results are written out.
+    Exceptions of the `fatal` types stop the whole pipeline instead of
+    dropping one item, e.g. a lost database connection in the write stage.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=100, fatal=()):
+        """
+        Args:
+            name (str): Name used in the utilisation report.
+            func (callable): Function applied to every item.
+            workers (int): Number of threads running the stage.
+            queue_size (int): Capacity of the queue feeding the stage.
+            fatal (tuple): Exception types that stop the pipeline.
+        """
+
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue_size = queue_size
+        self.fatal = fatal
+
+class Pipeline:
+    """
+    Stages connected by bounded queues.
+
+    All stages run at the same time, so fetching, parsing and writing
+    overlap. When a stage falls behind, its queue fills up and the stages
+    before it block, which keeps memory bounded.
+    """
+
+    def __init__(self, stages):
+        """
+        Args:
+            stages (list): Stages in processing order.
+        """
+
+        self.stages = stages
+
+    def run(self, items):
+        """
+        Push items through all stages and wait until they are processed.
+
+        Args:
+            items (iterable): Input items of the first stage.
+
+        Returns:
+            dict: Statistics per stage name: 'items', 'errors', 'busy'
+            (seconds spent in the stage function) and 'utilisation' (busy
+            time divided by workers times wall time).
+
+        Raises:
+            Exception: The first fatal error of a stage, after all threads
+                have stopped.
+        """
+
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        stats = {stage.name: {'items': 0, 'errors': 0, 'busy': 0.0} for stage in self.stages}
+        remaining = [stage.workers for stage in self.stages]
+        lock = threading.Lock()
+        stop = threading.Event()
+        fatal_errors = []
+
+        def work(index):
+            stage = self.stages[index]
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            items = errors = 0
+            busy = 0.0
+
+            while True:
+                item = inbox.get()
+                if item is _DONE:
+                    break
+                if stop.is_set():
+                    # Keep draining so the stages before do not block
+                    continue
+                start = time.perf_counter()
+                try:
+                    result = stage.func(item)
+                except stage.fatal as e:
+                    result = None
+                    with lock:
+                        fatal_errors.append(e)
+                    stop.set()
+                except Exception as e:
+                    result = None
+                    errors += 1
+                    print(f"Error in stage '{stage.name}': {e}")
+                    sys.stdout.flush()
+                busy += time.perf_counter() - start
+                items += 1
+                if outbox is not None and result is not None:
+                    outbox.put(result)
+
+            with lock:
+                stats[stage.name]['items'] += items
+                stats[stage.name]['errors'] += errors
+                stats[stage.name]['busy'] += busy
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            # The last worker of a stage tells every worker of the next one to stop
+            if last and outbox is not None:
+                for _ in range(self.stages[index + 1].workers):
+                    outbox.put(_DONE)
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for number in range(stage.workers):
+                thread = threading.Thread(target=work, args=(index,), name=f"{stage.name}-{number}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        start = time.perf_counter()
+        for item in items:
+            if stop.is_set():
+                break
+            queues[0].put(item)
+        for _ in range(self.stages[0].workers):
+            queues[0].put(_DONE)
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+
+        for stage in self.stages:
+            stage_stats = stats[stage.name]
+            stage_stats['utilisation'] = stage_stats['busy'] / (stage.workers * wall) if wall > 0 else 0.0
+        if fatal_errors:
+            raise fatal_errors[0]
+        return stats
+
+def report(stats):
+    """
+    Print the per-stage statistics returned by Pipeline.run().
+
+    Args:
+        stats (dict): Statistics per stage name.
+    """
+
+    for name, stage_stats in stats.items():
+        print(f"Stage '{name}': {stage_stats['items']} items, {stage_stats['errors']} errors, "
+              f"{stage_stats['busy']:.1f}s busy, {stage_stats['utilisation']:.0%} utilisation")
+    sys.stdout.flush()
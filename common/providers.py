@@ -0,0 +1,300 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+
+import requests
+
+from common import http_client, rate_limit
+
+HEDGE_WORKERS = 64
+
+_executor = None
+
+def fetch_openweathermap(lat, lon, provider_config):
+    """
+    Fetch current weather from OpenWeatherMap.
+
+    Args:
+        lat (float): Latitude of the location.
+        lon (float): Longitude of the location.
+        provider_config (dict): Provider settings with 'api_key'.
+
+    Returns:
+        dict: Weather data in the OpenWeatherMap format.
+    """
+
+    url = "https://api.openweathermap.org/data/2.5/weather"
+    params = {'lat': lat, 'lon': lon, 'appid': provider_config['api_key'], 'units': 'metric'}
+    response = http_client.get(url, params, provider='openweathermap')
+    response.raise_for_status()
+    return response.json()
+
+def _utc_time_today(value):
+    # Weatherbit reports sunrise and sunset as "HH:MM" in UTC
+    hours, minutes = value.split(':')
+    now = datetime.now(timezone.utc)
+    return int(now.replace(hour=int(hours), minute=int(minutes), second=0, microsecond=0).timestamp())
+
+def fetch_weatherbit(lat, lon, provider_config):
+    """
+    Fetch current weather from Weatherbit.
+
+    Weatherbit condition codes follow the OpenWeatherMap ones, so they are
+    kept as condition ids.
+
+    Args:
+        lat (float): Latitude of the location.
+        lon (float): Longitude of the location.
+        provider_config (dict): Provider settings with 'api_key'.
+
+    Returns:
+        dict: Weather data mapped to the OpenWeatherMap format.
+    """
+
+    url = "https://api.weatherbit.io/v2.0/current"
+    params = {'lat': lat, 'lon': lon, 'key': provider_config['api_key']}
+    response = http_client.get(url, params, provider='weatherbit')
+    response.raise_for_status()
+    data = response.json()['data'][0]
+
+    weather = data.get('weather', {})
+    return {
+        'weather': [{'id': weather.get('code'), 'main': None,
+                     'description': weather.get('description'), 'icon': weather.get('icon')}],
+        'main': {
+            'temp': data.get('temp'), 'feels_like': data.get('app_temp'),
+            'pressure': data.get('pres'), 'humidity': data.get('rh'),
+            'sea_level': data.get('slp')
+        },
+        'visibility': data['vis'] * 1000 if data.get('vis') is not None else None,
+        'wind': {'speed': data.get('wind_spd'), 'deg': data.get('wind_dir'), 'gust': data.get('gust')},
+        'clouds': {'all': data.get('clouds')},
+        'rain': {'1h': data.get('precip')},
+        'snow': {'1h': data.get('snow')},
+        'dt': data['ts'],
+        'sys': {
+            'sunrise': _utc_time_today(data['sunrise']) if data.get('sunrise') else None,
+            'sunset': _utc_time_today(data['sunset']) if data.get('sunset') else None
+        },
+        'timezone': None
+    }
+
+def fetch_tomorrowio(lat, lon, provider_config):
+    """
+    Fetch current weather from Tomorrow.io.
+
+    Tomorrow.io weather codes are stored in the weather JSON only, they are
+    not OpenWeatherMap condition ids.
+
+    Args:
+        lat (float): Latitude of the location.
+        lon (float): Longitude of the location.
+        provider_config (dict): Provider settings with 'api_key'.
+
+    Returns:
+        dict: Weather data mapped to the OpenWeatherMap format.
+    """
+
+    url = "https://api.tomorrow.io/v4/weather/realtime"
+    params = {'location': f"{lat},{lon}", 'apikey': provider_config['api_key'], 'units': 'metric'}
+    response = http_client.get(url, params, provider='tomorrowio')
+    response.raise_for_status()
+    data = response.json()['data']
+    values = data['values']
+
+    dt = datetime.fromisoformat(data['time'].replace('Z', '+00:00'))
+    return {
+        'weather': [{'provider': 'tomorrowio', 'code': values.get('weatherCode')}],
+        'main': {
+            'temp': values.get('temperature'), 'feels_like': values.get('temperatureApparent'),
+            'pressure': values.get('pressureSurfaceLevel'), 'humidity': values.get('humidity')
+        },
+        'visibility': values['visibility'] * 1000 if values.get('visibility') is not None else None,
+        'wind': {'speed': values.get('windSpeed'), 'deg': values.get('windDirection'), 'gust': values.get('windGust')},
+        'clouds': {'all': values.get('cloudCover')},
+        'rain': {'1h': values.get('rainIntensity')},
+        'snow': {'1h': values.get('snowIntensity')},
+        'dt': int(dt.timestamp()),
+        'sys': {},
+        'timezone': None
+    }
+
+def fetch_weatherstack(lat, lon, provider_config):
+    """
+    Fetch current weather from WeatherStack.
+
+    WeatherStack weather codes are stored in the weather JSON only, they are
+    not OpenWeatherMap condition ids.
+
+    Args:
+        lat (float): Latitude of the location.
+        lon (float): Longitude of the location.
+        provider_config (dict): Provider settings with 'api_key' and
+            optionally 'request_url'.
+
+    Returns:
+        dict: Weather data mapped to the OpenWeatherMap format.
+    """
+
+    url = provider_config.get('request_url', "http://api.weatherstack.com/current")
+    params = {'access_key': provider_config['api_key'], 'query': f"{lat},{lon}", 'units': 'm'}
+    response = http_client.get(url, params, provider='weatherstack')
+    response.raise_for_status()
+    data = response.json()
+    current = data['current']
+    location = data['location']
+
+    wind_speed = current.get('wind_speed')
+    return {
+        'weather': [{'provider': 'weatherstack', 'code': current.get('weather_code'),
+                     'description': ', '.join(current.get('weather_descriptions', []))}],
+        'main': {
+            'temp': current.get('temperature'), 'feels_like': current.get('feelslike'),
+            'pressure': current.get('pressure'), 'humidity': current.get('humidity')
+        },
+        'visibility': current['visibility'] * 1000 if current.get('visibility') is not None else None,
+        'wind': {'speed': wind_speed / 3.6 if wind_speed is not None else None, 'deg': current.get('wind_degree')},
+        'clouds': {'all': current.get('cloudcover')},
+        'rain': {'1h': current.get('precip')},
+        'snow': {},
+        'dt': location['localtime_epoch'],
+        'sys': {},
+        'timezone': int(float(location['utc_offset']) * 3600) if location.get('utc_offset') else None
+    }
+
+def fetch_aerisweather(lat, lon, provider_config):
+    """
+    Fetch current weather from AerisWeather.
+
+    Args:
+        lat (float): Latitude of the location.
+        lon (float): Longitude of the location.
+        provider_config (dict): Provider settings with 'client_id' and
+            'client_secret'.
+
+    Returns:
+        dict: Weather data mapped to the OpenWeatherMap format.
+    """
+
+    url = f"https://api.aerisapi.com/conditions/{lat},{lon}"
+    params = {
+        'format': 'json', 'plimit': 1, 'filter': '1min',
+        'client_id': provider_config['client_id'], 'client_secret': provider_config['client_secret']
+    }
+    response = http_client.get(url, params, provider='aerisweather')
+    response.raise_for_status()
+    period = response.json()['response'][0]['periods'][0]
+
+    return {
+        'weather': [{'provider': 'aerisweather', 'code': period.get('weatherPrimaryCoded'),
+                     'description': period.get('weatherPrimary')}],
+        'main': {
+            'temp': period.get('tempC'), 'feels_like': period.get('feelslikeC'),
+            'pressure': period.get('pressureMB'), 'humidity': period.get('humidity')
+        },
+        'visibility': period['visibilityKM'] * 1000 if period.get('visibilityKM') is not None else None,
+        'wind': {'speed': period.get('windSpeedMPS'), 'deg': period.get('windDirDEG'), 'gust': period.get('windGustMPS')},
+        'clouds': {'all': period.get('sky')},
+        'rain': {'1h': period.get('precipMM')},
+        'snow': {'1h': period['snowCM'] * 10 if period.get('snowCM') is not None else None},
+        'dt': period['timestamp'],
+        'sys': {},
+        'timezone': None
+    }
+
+PROVIDERS = {
+    'openweathermap': fetch_openweathermap,
+    'weatherbit': fetch_weatherbit,
+    'tomorrowio': fetch_tomorrowio,
+    'weatherstack': fetch_weatherstack,
+    'aerisweather': fetch_aerisweather,
+}
+
+def fetch_current(provider, lat, lon, provider_config):
+    """
+    Fetch current weather from a provider in the OpenWeatherMap format.
+
+    Args:
+        provider (str): Name of the provider, a key of PROVIDERS.
+        lat (float): Latitude of the location.
+        lon (float): Longitude of the location.
+        provider_config (dict): Settings of the provider (API keys).
+
+    Returns:
+        dict: Weather data, or None if the request failed.
+    """
+
+    try:
+        return PROVIDERS[provider](lat, lon, provider_config)
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching data from {provider}: {e}")
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        print(f"Unexpected response from {provider}: {e}")
+    sys.stdout.flush()
+    return None
+
+def _fetch_prepaid(provider, lat, lon, provider_config):
+    # The caller already took the rate limit token of this request
+    with rate_limit.prepaid(provider):
+        return fetch_current(provider, lat, lon, provider_config)
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS)
+    return _executor
+
+def fetch_hedged(lat, lon, providers, provider_configs, latency_budget):
+    """
+    Fetch current weather, asking the next provider if one is too slow.
+
+    The first provider is asked right away. Whenever no answer has arrived
+    within `latency_budget` seconds, or a provider fails, the same request is
+    sent to the next provider in the list. Only the first provider waits for
+    its rate limit, and its token is taken before the budget starts, so
+    waiting for the local limiter is not counted as latency. Fallback
+    providers without quota left right now are skipped. The first successful
+    answer wins; slower requests still in flight are ignored.
+
+    Args:
+        lat (float): Latitude of the location.
+        lon (float): Longitude of the location.
+        providers (list): Provider names in order of preference.
+        provider_configs (dict): Settings of each provider, keyed by name.
+        latency_budget (float): Seconds to wait before hedging.
+
+    Returns:
+        tuple: (provider name, weather data), or (None, None) if all failed.
+    """
+
+    executor = _get_executor()
+    remaining = list(providers)
+    pending = {}
+
+    def submit_next():
+        while remaining:
+            provider = remaining.pop(0)
+            if provider == providers[0]:
+                rate_limit.acquire(provider)
+            elif not rate_limit.try_acquire(provider):
+                continue
+            config = provider_configs.get(provider, {})
+            pending[executor.submit(_fetch_prepaid, provider, lat, lon, config)] = provider
+            return
+
+    submit_next()
+    while pending:
+        done, _ = wait(pending, timeout=latency_budget if remaining else None, return_when=FIRST_COMPLETED)
+        if not done:
+            submit_next()
+            continue
+
+        for future in done:
+            provider = pending.pop(future)
+            weather_data = future.result()
+            if weather_data:
+                return provider, weather_data
+            # Failed, ask the next provider without waiting for the budget
+            submit_next()
+    return None, None
@@ -0,0 +1,212 @@
+import threading
+import time
+from contextlib import contextmanager
+
+_buckets = {}
+_prepaid = threading.local()
+
+class TokenBucket:
+    """
+    Token bucket that hands out requests at an even rate.
+
+    With the default burst of 1, requests are spaced `per / requests` seconds
+    apart, so a quota is spread over its whole period instead of being spent
+    at the start of it.
+    """
+
+    def __init__(self, requests, per, burst=1):
+        """
+        Args:
+            requests (int): Number of requests allowed per period.
+            per (float): Length of the period in seconds.
+            burst (int): Number of requests that may be sent back to back.
+        """
+
+        self.rate = requests / per
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Block until a request may be sent.
+        """
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def try_acquire(self):
+        """
+        Take a token if one is available right now, without waiting.
+
+        Returns:
+            bool: True if a token was taken, False otherwise.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return False
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def available(self):
+        """
+        Check if a request could be sent right now without waiting.
+
+        Returns:
+            bool: True if a token is available, False otherwise.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return False
+            return self.tokens + (now - self.updated) * self.rate >= 1
+
+    def pause(self, seconds):
+        """
+        Hold back all requests for the given number of seconds.
+
+        Args:
+            seconds (float): How long to wait before the next request.
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.tokens = 0
+            self.updated = self.blocked_until
+
+def configure(config):
+    """
+    Create a token bucket for every provider in the 'rate_limits' section.
+
+    Each entry has the form {"requests": 60, "per": 60, "burst": 1}, where
+    'per' is the quota period in seconds (60 per minute, 86400 per day,
+    2592000 per month). Providers without an entry are not limited.
+
+    Args:
+        config (dict): Configuration settings.
+    """
+
+    _buckets.clear()
+    for provider, quota in config.get('rate_limits', {}).items():
+        _buckets[provider] = TokenBucket(quota['requests'], quota['per'], quota.get('burst', 1))
+
+def acquire(provider):
+    """
+    Block until a request to the provider fits into its quota.
+
+    Inside prepaid(), the first call for the provider returns at once, the
+    token was already taken by the caller.
+
+    Args:
+        provider (str): Provider name as used in the 'rate_limits' section.
+    """
+
+    if provider is not None and getattr(_prepaid, 'provider', None) == provider:
+        _prepaid.provider = None
+        return
+    bucket = _buckets.get(provider)
+    if bucket is not None:
+        bucket.acquire()
+
+def try_acquire(provider):
+    """
+    Take a token of the provider if one is available, without waiting.
+
+    Args:
+        provider (str): Provider name as used in the 'rate_limits' section.
+
+    Returns:
+        bool: True if the provider is not limited or a token was taken.
+    """
+
+    bucket = _buckets.get(provider)
+    return bucket is None or bucket.try_acquire()
+
+@contextmanager
+def prepaid(provider):
+    """
+    Let the next acquire() of a provider in this thread use a token taken earlier.
+
+    Used when a token is acquired in one thread and the request is sent from
+    another, e.g. so that waiting for the token is not timed as request
+    latency.
+
+    Args:
+        provider (str): Provider name as used in the 'rate_limits' section.
+    """
+
+    _prepaid.provider = provider
+    try:
+        yield
+    finally:
+        _prepaid.provider = None
+
+def available(provider):
+    """
+    Check if a request to the provider could be sent without waiting.
+
+    Args:
+        provider (str): Provider name as used in the 'rate_limits' section.
+
+    Returns:
+        bool: True if the provider is not limited or has quota left now.
+    """
+
+    bucket = _buckets.get(provider)
+    return bucket is None or bucket.available()
+
+def pause(provider, seconds):
+    """
+    Hold back requests to a provider, e.g. after it answered with Retry-After.
+
+    Args:
+        provider (str): Provider name as used in the 'rate_limits' section.
+        seconds (float): How long to wait before the next request.
+
+    Returns:
+        bool: True if the provider is limited and was paused, False otherwise.
+    """
+
+    bucket = _buckets.get(provider)
+    if bucket is None:
+        return False
+    bucket.pause(seconds)
+    return True
+
+def requests_per_period(provider, period):
+    """
+    Get how many requests to a provider fit into a period.
+
+    Args:
+        provider (str): Provider name as used in the 'rate_limits' section.
+        period (float): Length of the period in seconds.
+
+    Returns:
+        float: Number of requests, or None if the provider is not limited.
+    """
+
+    bucket = _buckets.get(provider)
+    if bucket is None:
+        return None
+    return bucket.rate * period + bucket.capacity
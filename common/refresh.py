@@ -0,0 +1,110 @@
+import json
+import sys
+import time
+
+class RefreshPlan:
+    """
+    Per-stop refresh intervals loaded from a refresh tiers file.
+
+    The file is written by compute_refresh_tiers.py. Each cycle, due() picks
+    the items whose stops are due for a new observation, and the fetcher
+    calls mark_fetched() for those it fetched successfully, so failed stops
+    stay due. An item covering several stops (a grid cell) uses the shortest
+    interval of its stops. Stops missing from the file use the default
+    interval of the file.
+    """
+
+    def __init__(self, intervals, default_interval, tick):
+        """
+        Args:
+            intervals (dict): Refresh interval in seconds per stop id.
+            default_interval (float): Interval of stops without a tier.
+            tick (float): Seconds between fetch cycles, an item is due if it
+                would be late by the next cycle.
+        """
+
+        self.intervals = intervals
+        self.default_interval = default_interval
+        self.tick = tick
+        self.last_fetched = {}
+        self.cycle_start = None
+
+    @classmethod
+    def load(cls, path, tick, default_interval=3600):
+        """
+        Load a refresh tiers file.
+
+        Args:
+            path (str): Path of the JSON file.
+            tick (float): Seconds between fetch cycles.
+            default_interval (float): Interval of all stops if the file
+                cannot be read.
+
+        Returns:
+            RefreshPlan: The plan.
+        """
+
+        try:
+            with open(path, 'r') as file:
+                tiers = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Unable to load refresh tiers from '{path}', refreshing all stops every {default_interval}s: {e}")
+            sys.stdout.flush()
+            return cls({}, default_interval, tick)
+
+        intervals = {}
+        for tier in tiers['tiers']:
+            for stop_id in tier['stops']:
+                intervals[stop_id] = tier['interval']
+        return cls(intervals, tiers.get('default_interval', default_interval), tick)
+
+    def interval(self, stop_ids):
+        """
+        Get the refresh interval of an item covering the given stops.
+
+        Args:
+            stop_ids (iterable): IDs of the stops.
+
+        Returns:
+            float: Shortest interval of the stops in seconds.
+        """
+
+        return min((self.intervals.get(int(stop_id), self.default_interval) for stop_id in stop_ids),
+                   default=self.default_interval)
+
+    def due(self, items, stop_ids):
+        """
+        Select the items that are due in this cycle.
+
+        Args:
+            items (iterable): Items of the cycle.
+            stop_ids (callable): Function returning the stop ids of an item.
+
+        Returns:
+            list: Items to fetch in this cycle.
+        """
+
+        now = time.monotonic()
+        due = []
+        for item in items:
+            key = tuple(stop_ids(item))
+            last = self.last_fetched.get(key)
+            # Half a tick of slack so jitter does not push a stop to the next cycle
+            if last is None or now - last + self.tick / 2 >= self.interval(key):
+                due.append(item)
+        self.cycle_start = now
+        return due
+
+    def mark_fetched(self, stop_ids):
+        """
+        Record that an item selected by the last due() call was fetched.
+
+        The item counts as fetched at the start of the cycle, so pacing the
+        requests over the cycle does not push it to a later cycle.
+
+        Args:
+            stop_ids (iterable): Stop ids of the item, as returned by the
+                `stop_ids` function given to due().
+        """
+
+        self.last_fetched[tuple(stop_ids)] = self.cycle_start
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, parse_qsl
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.response_cache.sqlite')
+MAX_ENTRIES = 50000
+PRECISION = 3
+
+# Seconds a response stays valid, keyed by host or host/path prefix.
+# -1 keeps a response forever, 0 disables caching.
+DEFAULT_TTLS = {
+    'archive-api.open-meteo.com': -1,
+    'api.open-meteo.com': 900,
+    'api.openweathermap.org': 600,
+    'api.weatherbit.io': 900,
+    'api.tomorrow.io': 300,
+    'api.weatherstack.com': 300,
+    'api.aerisapi.com': 60,
+}
+
+COORDINATE_PARAMS = {'lat', 'lon', 'latitude', 'longitude', 'location', 'query'}
+
+# Headers that describe the encoded body and no longer apply to the stored one
+DROPPED_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+def _round_coordinates(value, precision):
+    try:
+        return ','.join(f"{float(part):.{precision}f}" for part in str(value).split(','))
+    except ValueError:
+        return value
+
+def make_key(url, params=None, precision=PRECISION):
+    """
+    Build a cache key from a URL and its query parameters.
+
+    Coordinates are rounded to `precision` decimal places, so requests for
+    stops a few metres apart share one entry. The key is hashed so API keys
+    in the URL are not stored in the cache file.
+
+    Args:
+        url (str): Requested URL, possibly with a query string.
+        params (dict): Additional query parameters.
+        precision (int): Decimal places kept from coordinates.
+
+    Returns:
+        str: Cache key.
+    """
+
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        for name, value in params.items():
+            values = value if isinstance(value, (list, tuple)) else [value]
+            query.extend((name, str(item)) for item in values)
+
+    query = sorted(
+        (name, _round_coordinates(value, precision) if name in COORDINATE_PARAMS else value)
+        for name, value in query
+    )
+    canonical = f"{parts.netloc}{parts.path}?{json.dumps(query)}"
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+def ttl_for(url, ttls):
+    """
+    Find the time to live for a URL from the longest matching prefix.
+
+    Args:
+        url (str): Requested URL.
+        ttls (dict): Seconds to live keyed by host or host/path prefix.
+
+    Returns:
+        float: Seconds to live, -1 for no expiry, 0 if the URL is not cached.
+    """
+
+    parts = urlsplit(url)
+    target = f"{parts.netloc}{parts.path}"
+    matches = [prefix for prefix in ttls if target.startswith(prefix)]
+    if not matches:
+        return 0
+    return ttls[max(matches, key=len)]
+
+class ResponseCache:
+    """
+    Size-bounded response cache stored in SQLite.
+
+    Entries expire after their time to live. When the cache holds more than
+    `max_entries` responses, the least recently used ones are evicted. The
+    file can be shared by several fetchers and survives restarts.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=MAX_ENTRIES):
+        """
+        Args:
+            path (str): Path of the SQLite file.
+            max_entries (int): Maximum number of stored responses.
+        """
+
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                status INTEGER,
+                headers TEXT,
+                body BLOB,
+                expires REAL,
+                accessed REAL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT count(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """
+        Look up a stored response.
+
+        Args:
+            key (str): Cache key from make_key().
+
+        Returns:
+            tuple: (status, headers, body), or None if missing or expired.
+        """
+
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, headers, body, expires FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[3] is not None and row[3] < now:
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.conn.commit()
+                self.size -= 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        return row[0], json.loads(row[1]), row[2]
+
+    def put(self, key, status, headers, body, ttl):
+        """
+        Store a response, evicting the least recently used ones if full.
+
+        Args:
+            key (str): Cache key from make_key().
+            status (int): HTTP status code.
+            headers (dict): Response headers.
+            body (bytes): Decoded response body.
+            ttl (float): Seconds to live, -1 for no expiry.
+        """
+
+        now = time.time()
+        expires = None if ttl < 0 else now + ttl
+        with self.lock:
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO responses (key) VALUES (?)", (key,)
+            ).rowcount
+            self.conn.execute(
+                "UPDATE responses SET status = ?, headers = ?, body = ?, expires = ?, accessed = ? WHERE key = ?",
+                (status, json.dumps(headers), body, expires, now, key)
+            )
+            self.size += inserted
+            if self.size > self.max_entries:
+                self._evict(now)
+            self.conn.commit()
+
+    def _evict(self, now):
+        self.conn.execute("DELETE FROM responses WHERE expires IS NOT NULL AND expires < ?", (now,))
+        self.conn.execute(
+            """
+            DELETE FROM responses WHERE key IN (
+                SELECT key FROM responses ORDER BY accessed
+                LIMIT max(0, (SELECT count(*) FROM responses) - ?)
+            )
+            """,
+            (self.max_entries,)
+        )
+        self.size = self.conn.execute("SELECT count(*) FROM responses").fetchone()[0]
+
+class CachedSession(requests.Session):
+    """
+    Session that answers GET requests from a ResponseCache when it can.
+
+    Only successful responses to URLs with a time to live are stored.
+    Responses served from the cache have `from_cache` set to True.
+    """
+
+    def __init__(self, cache=None, ttls=None, precision=PRECISION):
+        """
+        Args:
+            cache (ResponseCache): Cache to use, None to disable caching.
+            ttls (dict): Seconds to live keyed by host or host/path prefix.
+            precision (int): Decimal places kept from coordinates in keys.
+        """
+
+        super().__init__()
+        self.cache = cache
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.precision = precision
+
+    def lookup(self, url, params=None):
+        """
+        Get a cached response without sending a request.
+
+        Args:
+            url (str): URL to request.
+            params (dict): Query string parameters.
+
+        Returns:
+            requests.Response: Cached response, or None on a miss.
+        """
+
+        if self.cache is None or not ttl_for(url, self.ttls):
+            return None
+        entry = self.cache.get(make_key(url, params, self.precision))
+        if entry is None:
+            return None
+
+        status, headers, body = entry
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = body
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = url
+        response.from_cache = True
+        return response
+
+    def request(self, method, url, params=None, **kwargs):
+        if method.upper() != 'GET':
+            return super().request(method, url, params=params, **kwargs)
+
+        cached = self.lookup(url, params)
+        if cached is not None:
+            return cached
+
+        response = super().request(method, url, params=params, **kwargs)
+        response.from_cache = False
+        ttl = ttl_for(url, self.ttls)
+        if self.cache is not None and ttl and response.status_code == 200:
+            headers = {
+                name: value for name, value in response.headers.items()
+                if name.lower() not in DROPPED_HEADERS
+            }
+            self.cache.put(make_key(url, params, self.precision), response.status_code,
+                           headers, response.content, ttl)
+        return response
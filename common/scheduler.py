@@ -0,0 +1,84 @@
+import math
+import sys
+import time
+
+class Scheduler:
+    """
+    Fixed-rate cycle clock aligned to wall time.
+
+    Cycles start on multiples of `period` seconds since the epoch, so an
+    hourly period starts every cycle on the full hour no matter how long
+    the previous one took. The first cycle starts right away and runs until
+    the next aligned slot. A cycle that is still running when its next slot
+    begins is an overrun: it is reported and the next cycle starts right
+    away, in what is left of that slot. Only slots that passed entirely are
+    skipped, and the cycle after is aligned again.
+    """
+
+    def __init__(self, period, spread=0.8):
+        """
+        Args:
+            period (float): Seconds between cycle starts.
+            spread (float): Fraction of the slot over which paced() spreads
+                the items of a cycle, the rest is left for writing them out.
+        """
+
+        self.period = period
+        self.spread = spread
+        self.slot_start = None
+        self.next_start = None
+        self.overruns = 0
+
+    def wait(self):
+        """
+        Sleep until the next slot starts.
+
+        Returns:
+            float: Wall time at which the slot started.
+        """
+
+        now = time.time()
+        if self.next_start is None:
+            self.slot_start = now
+            self.next_start = math.floor(now / self.period) * self.period + self.period
+            return self.slot_start
+
+        if now > self.next_start:
+            missed = math.floor((now - self.next_start) / self.period)
+            self.overruns += 1
+            print(f"Cycle overran its slot by {now - self.next_start:.1f}s, skipping {missed} slot(s) and starting right away")
+            sys.stdout.flush()
+            self.slot_start = now
+            self.next_start += (missed + 1) * self.period
+            return self.slot_start
+
+        print(f"Sleeping for {self.next_start - now:.0f}s until the next cycle")
+        sys.stdout.flush()
+        time.sleep(self.next_start - now)
+
+        self.slot_start = self.next_start
+        self.next_start += self.period
+        return self.slot_start
+
+    def paced(self, items, count=None):
+        """
+        Yield items evenly spaced over the current slot instead of all at once.
+
+        Args:
+            items (iterable): Items of the cycle.
+            count (int): Number of items, len(items) if None.
+
+        Yields:
+            Each item, not before its share of the slot has started.
+        """
+
+        count = len(items) if count is None else count
+        if not count:
+            return
+        start = time.time()
+        interval = max(self.next_start - start, 0) * self.spread / count
+        for index, item in enumerate(items):
+            pause = start + index * interval - time.time()
+            if pause > 0:
+                time.sleep(pause)
+            yield item
@@ -0,0 +1,241 @@
+import argparse
+import csv
+import heapq
+import json
+import math
+import time
+
+EARTH_RADIUS_KM = 6371.0088
+
+def to_unit_vector(lat, lon):
+    """
+    Project a coordinate onto the unit sphere.
+
+    Straight-line (chord) distances between the vectors grow monotonically
+    with great-circle distances, so a KD-tree over them answers geographic
+    queries without any distortion near the poles or the antimeridian.
+
+    Args:
+        lat (float): Latitude in degrees.
+        lon (float): Longitude in degrees.
+
+    Returns:
+        tuple: (x, y, z) on the unit sphere.
+    """
+
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+def chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+def km_to_chord(km):
+    return 2 * math.sin(min(km / EARTH_RADIUS_KM, math.pi) / 2)
+
+class StopIndex:
+    """
+    KD-tree of bus stops for nearest-stop and radius queries.
+
+    The tree is stored implicitly in one list: the median of every range
+    splits it on the x, y or z axis in turn. Stops without coordinates
+    (0, 0) are left out.
+    """
+
+    def __init__(self, stops):
+        """
+        Args:
+            stops (iterable): (stop_id, latitude, longitude, name) tuples.
+        """
+
+        self.stops = [stop for stop in stops if stop[1] != 0 or stop[2] != 0]
+        self.points = [to_unit_vector(float(stop[1]), float(stop[2])) for stop in self.stops]
+        self.order = list(range(len(self.stops)))
+        self._build(0, len(self.order), 0)
+
+    @classmethod
+    def from_csv(cls, file_path):
+        """
+        Build the index from a stops CSV file (see data/stops.csv).
+
+        Args:
+            file_path (str): Path of the ';' separated CSV file with comma decimals.
+
+        Returns:
+            StopIndex: The index.
+        """
+
+        with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile, delimiter=';')
+            next(reader)  # Skip header
+            stops = [
+                (int(row[0]), float(row[1].replace(',', '.')), float(row[2].replace(',', '.')), f"{row[5]}, {row[7]}")
+                for row in reader
+            ]
+        return cls(stops)
+
+    @classmethod
+    def from_database(cls, conn):
+        """
+        Build the index from the 'Locations' table.
+
+        Args:
+            conn (psycopg2.connection): Connection object to the PostgreSQL database.
+
+        Returns:
+            StopIndex: The index.
+        """
+
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT stop_id, latitude, longitude, town || ', ' || stop_name FROM Locations")
+            stops = cursor.fetchall()
+        conn.commit()
+        return cls(stops)
+
+    def __len__(self):
+        return len(self.stops)
+
+    def _build(self, lo, hi, axis):
+        if hi - lo <= 1:
+            return
+        mid = (lo + hi) // 2
+        self.order[lo:hi] = sorted(self.order[lo:hi], key=lambda index: self.points[index][axis])
+        self._build(lo, mid, (axis + 1) % 3)
+        self._build(mid + 1, hi, (axis + 1) % 3)
+
+    def _result(self, chord_squared, index):
+        stop_id, lat, lon, name = self.stops[index]
+        return chord_to_km(math.sqrt(chord_squared)), stop_id, name
+
+    def nearest(self, lat, lon, k=1):
+        """
+        Find the k stops closest to a coordinate.
+
+        Args:
+            lat (float): Latitude in degrees.
+            lon (float): Longitude in degrees.
+            k (int): Number of stops, no stops are returned if below 1.
+
+        Returns:
+            list: (distance in km, stop_id, name) tuples, nearest first.
+        """
+
+        if k < 1:
+            return []
+        target = to_unit_vector(lat, lon)
+        points = self.points
+        order = self.order
+        best = []  # max-heap of (-chord squared, index)
+
+        def search(lo, hi, axis):
+            if lo >= hi:
+                return
+            mid = (lo + hi) // 2
+            index = order[mid]
+            point = points[index]
+            distance = ((point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2
+                        + (point[2] - target[2]) ** 2)
+            if len(best) < k:
+                heapq.heappush(best, (-distance, index))
+            elif distance < -best[0][0]:
+                heapq.heapreplace(best, (-distance, index))
+
+            difference = target[axis] - point[axis]
+            near, far = ((lo, mid), (mid + 1, hi)) if difference < 0 else ((mid + 1, hi), (lo, mid))
+            search(near[0], near[1], (axis + 1) % 3)
+            if len(best) < k or difference * difference < -best[0][0]:
+                search(far[0], far[1], (axis + 1) % 3)
+
+        search(0, len(order), 0)
+        return [self._result(-distance, index) for distance, index in sorted(best, reverse=True)]
+
+    def within(self, lat, lon, radius_km):
+        """
+        Find all stops within a distance of a coordinate.
+
+        Args:
+            lat (float): Latitude in degrees.
+            lon (float): Longitude in degrees.
+            radius_km (float): Great-circle radius in km.
+
+        Returns:
+            list: (distance in km, stop_id, name) tuples, nearest first.
+        """
+
+        target = to_unit_vector(lat, lon)
+        limit = km_to_chord(radius_km) ** 2
+        points = self.points
+        order = self.order
+        found = []
+
+        def search(lo, hi, axis):
+            if lo >= hi:
+                return
+            mid = (lo + hi) // 2
+            index = order[mid]
+            point = points[index]
+            distance = ((point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2
+                        + (point[2] - target[2]) ** 2)
+            if distance <= limit:
+                found.append((distance, index))
+
+            difference = target[axis] - point[axis]
+            if difference <= 0 or difference * difference <= limit:
+                search(lo, mid, (axis + 1) % 3)
+            if difference >= 0 or difference * difference <= limit:
+                search(mid + 1, hi, (axis + 1) % 3)
+
+        search(0, len(order), 0)
+        return [self._result(distance, index) for distance, index in sorted(found)]
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+def main():
+    parser = argparse.ArgumentParser(description="Find bus stops near a coordinate.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv', help="stops CSV file, e.g. data/stops.csv")
+    source.add_argument('--config', help="config.json with the PostgreSQL connection parameters")
+    subparsers = parser.add_subparsers(dest='query', required=True)
+
+    nearest = subparsers.add_parser('nearest', help="k nearest stops")
+    nearest.add_argument('lat', type=float)
+    nearest.add_argument('lon', type=float)
+    nearest.add_argument('-k', type=positive_int, default=1, help="number of stops (default: 1)")
+
+    within = subparsers.add_parser('within', help="stops within a radius")
+    within.add_argument('lat', type=float)
+    within.add_argument('lon', type=float)
+    within.add_argument('radius', type=float, help="radius in km")
+
+    args = parser.parse_args()
+
+    if args.csv:
+        index = StopIndex.from_csv(args.csv)
+    else:
+        import psycopg2
+
+        with open(args.config, 'r') as file:
+            config = json.load(file)
+        conn = psycopg2.connect(dbname=config['dbname'], user=config['user'],
+                                password=config['password'], host=config['host'])
+        try:
+            index = StopIndex.from_database(conn)
+        finally:
+            conn.close()
+
+    start = time.perf_counter()
+    if args.query == 'nearest':
+        results = index.nearest(args.lat, args.lon, args.k)
+    else:
+        results = index.within(args.lat, args.lon, args.radius)
+    elapsed = time.perf_counter() - start
+
+    for distance, stop_id, name in results:
+        print(f"{stop_id}\t{distance:.3f} km\t{name}")
+    print(f"{len(results)} of {len(index)} stops in {elapsed * 1000:.3f} ms")
+
+if __name__ == "__main__":
+    main()
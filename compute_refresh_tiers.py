@@ -0,0 +1,93 @@
+import csv
+import json
+import math
+import sys
+
+# Refresh intervals in seconds, from the busiest stops to the quiet ones
+TIER_INTERVALS = [300, 600, 900, 1800, 3600]
+
+def count_trips(file_path):
+    trip_count = {}
+    with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
+        csv_reader = csv.DictReader(csvfile, delimiter=';')
+        for row in csv_reader:
+            stop_id = int(row['StopId'])
+            trip_count[stop_id] = trip_count.get(stop_id, 0) + 1
+    return trip_count
+
+def read_stop_ids(file_path):
+    with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
+        csv_reader = csv.DictReader(csvfile, delimiter=';')
+        return [int(row['Cislo zastavky']) for row in csv_reader]
+
+def snap_interval(rate):
+    # Fastest tier whose rate (requests per hour) does not exceed the given one
+    for interval in TIER_INTERVALS:
+        if 3600 / interval <= rate:
+            return interval
+    return TIER_INTERVALS[-1]
+
+def assign_intervals(trip_count, stop_ids, budget):
+    """
+    Assign a refresh interval to every stop within a request budget.
+
+    The refresh rate of a stop is proportional to the square root of its
+    trip count, which spreads the budget between busy and quiet stops
+    instead of spending it all on the busiest ones. Rates are rounded down
+    to the tiers, and every stop is refreshed at least at the slowest tier.
+    The scale of the rates is found by bisection so that the total stays
+    within the budget.
+    """
+
+    weights = {stop_id: math.sqrt(trip_count.get(stop_id, 0)) for stop_id in stop_ids}
+
+    def intervals_at(scale):
+        return {stop_id: snap_interval(scale * weight) for stop_id, weight in weights.items()}
+
+    def cost(intervals):
+        return sum(3600 / interval for interval in intervals.values())
+
+    # At `high` even the quietest stop with trips gets the fastest tier
+    positive = [weight for weight in weights.values() if weight > 0]
+    low = 0.0
+    high = 3600 / TIER_INTERVALS[0] / min(positive) if positive else 0.0
+    if cost(intervals_at(low)) > budget:
+        print(f"A budget of {budget} requests per hour cannot refresh {len(stop_ids)} stops hourly, using the slowest tier for all")
+        return intervals_at(low)
+    for _ in range(60):
+        middle = (low + high) / 2
+        if cost(intervals_at(middle)) <= budget:
+            low = middle
+        else:
+            high = middle
+    return intervals_at(low)
+
+def main():
+    if len(sys.argv) != 5:
+        print("Usage: compute_refresh_tiers.py <trip_file> <stop_file> <output_file> <requests_per_hour>")
+        sys.exit(1)
+
+    trip_file_path, stop_file_path, output_file_path = sys.argv[1:4]
+    budget = float(sys.argv[4])
+
+    trip_count = count_trips(trip_file_path)
+    stop_ids = sorted(set(read_stop_ids(stop_file_path)) | set(trip_count))
+    intervals = assign_intervals(trip_count, stop_ids, budget)
+
+    tiers = {interval: [] for interval in TIER_INTERVALS}
+    for stop_id, interval in intervals.items():
+        tiers[interval].append(stop_id)
+
+    with open(output_file_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'budget': budget,
+            'default_interval': TIER_INTERVALS[-1],
+            'tiers': [{'interval': interval, 'stops': stops} for interval, stops in tiers.items() if stops]
+        }, f, indent=2)
+
+    for interval, stops in tiers.items():
+        print(f"Every {interval // 60} min: {len(stops)} stops")
+    print(f"{sum(3600 / interval for interval in intervals.values()):.0f} of {budget:.0f} requests per hour used")
+
+if __name__ == "__main__":
+    main()
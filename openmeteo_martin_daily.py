@@ -1,13 +1,12 @@
 import openmeteo_requests
-import requests_cache
 import pandas as pd
 from retry_requests import retry
 import matplotlib.pyplot as plt
+from common import http_client
 
 try:
-    # Setup the Open-Meteo API client with cache and retry on error
-    cache_session = requests_cache.CachedSession('.cache', expire_after=-1)
-    retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
+    # Setup the Open-Meteo API client with the shared cache and retry on error
+    retry_session = retry(http_client.get_session(), retries=5, backoff_factor=0.2)
     openmeteo = openmeteo_requests.Client(session=retry_session)
 
     # Stop 53916 - Zilinska univerzita
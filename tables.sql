@@ -10,7 +10,7 @@ CREATE TABLE Locations (
 );
 
 CREATE TABLE WeatherData (
-    weather_id SERIAL PRIMARY KEY,
+    weather_id SERIAL,
     location_id INT REFERENCES Locations(stop_id),
     weather JSONB,
     main_temp DECIMAL,
@@ -30,8 +30,20 @@ CREATE TABLE WeatherData (
     rain_3h DECIMAL,
     snow_1h DECIMAL,
     snow_3h DECIMAL,
-    dt TIMESTAMP,
+    dt TIMESTAMP NOT NULL,
     sys_sunrise TIMESTAMP,
     sys_sunset TIMESTAMP,
-    timezone INT
+    timezone INT,
+    PRIMARY KEY (weather_id, dt)
+) PARTITION BY RANGE (dt);
+
+CREATE UNIQUE INDEX weatherdata_location_dt_key ON WeatherData (location_id, dt);
+CREATE INDEX weatherdata_dt_brin ON WeatherData USING BRIN (dt);
+
+-- Monthly partitions are created ahead of time by fetch_weather.py
+
+-- Latest observation per stop, kept up to date by fetch_weather.py
+CREATE TABLE WeatherLatest (
+    LIKE WeatherData,
+    PRIMARY KEY (location_id)
 );
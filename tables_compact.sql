@@ -0,0 +1,47 @@
+-- Compact layout of WeatherData, used when config.json has "storage": "compact".
+-- Locations is the same as in tables.sql.
+
+CREATE TABLE weather_conditions (
+    condition_id SMALLINT PRIMARY KEY,
+    main VARCHAR(50),
+    description VARCHAR(100)
+);
+
+CREATE TABLE WeatherData (
+    weather_id SERIAL,
+    location_id INT REFERENCES Locations(stop_id),
+    weather_ids SMALLINT[],
+    main_temp REAL,
+    main_feels_like REAL,
+    main_temp_min REAL,
+    main_temp_max REAL,
+    main_pressure SMALLINT,
+    main_humidity SMALLINT,
+    main_sea_level INT,
+    main_grnd_level INT,
+    visibility INT,
+    wind_speed REAL,
+    wind_deg SMALLINT,
+    wind_gust REAL,
+    clouds_all SMALLINT,
+    rain_1h REAL,
+    rain_3h REAL,
+    snow_1h REAL,
+    snow_3h REAL,
+    dt TIMESTAMP NOT NULL,
+    sys_sunrise TIMESTAMP,
+    sys_sunset TIMESTAMP,
+    timezone INT,
+    PRIMARY KEY (weather_id, dt)
+) PARTITION BY RANGE (dt);
+
+CREATE UNIQUE INDEX weatherdata_location_dt_key ON WeatherData (location_id, dt);
+CREATE INDEX weatherdata_dt_brin ON WeatherData USING BRIN (dt);
+
+-- Monthly partitions are created ahead of time by fetch_weather.py
+
+-- Latest observation per stop, kept up to date by fetch_weather.py
+CREATE TABLE WeatherLatest (
+    LIKE WeatherData,
+    PRIMARY KEY (location_id)
+);
@@ -1,11 +1,334 @@
 import requests
-from datetime import datetime
 import json
+import os
 import time
 import sys
+import queue
+import threading
 import hopsworks
+import numpy as np
 import pandas as pd
 import uuid
+from dateutil.tz import tzlocal
+from functools import partial
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common import http_client
+from common.extract import WEATHER_FIELDS, FieldExtractor
+from common.pipeline import Pipeline, Stage, report
+from common.refresh import RefreshPlan
+from common.scheduler import Scheduler
+
+# Fields that have no default in the 'weather_data' feature group
+REQUIRED_FIELDS = (
+    'weather', 'main_temp', 'main_feels_like', 'main_temp_min', 'main_temp_max',
+    'main_pressure', 'main_humidity', 'wind_speed', 'wind_deg', 'clouds_all',
+    'dt', 'sys_sunrise', 'sys_sunset', 'timezone'
+)
+
+_extractor = FieldExtractor(WEATHER_FIELDS, default=0, required=REQUIRED_FIELDS)
+
+# Seconds before a failed insert is tried again, doubled up to the maximum
+UPLOAD_RETRY_DELAY = 5
+MAX_UPLOAD_RETRY_DELAY = 300
+# Attempts per chunk once the uploader is stopping
+STOP_UPLOAD_ATTEMPTS = 3
+
+# Columns of the stops feature view used by the fetcher
+STOP_COLUMNS = ('cislo_zastavky', 'zemepisna_sirka', 'zemepisna_dlzka', 'obec', 'nazov_zastavky')
+
+# Buffer type of each weather column, timestamps are kept as epoch seconds until the frame is built
+COLUMN_DTYPES = {
+    'weather': object,
+    'main_temp': np.float64, 'main_feels_like': np.float64,
+    'main_temp_min': np.float64, 'main_temp_max': np.float64,
+    'main_pressure': np.int64, 'main_humidity': np.int64,
+    'main_sea_level': np.int64, 'main_grnd_level': np.int64,
+    'visibility': np.int64, 'wind_speed': np.float64,
+    'wind_deg': np.int64, 'wind_gust': np.float64, 'clouds_all': np.int64,
+    'rain_1h': np.float64, 'rain_3h': np.float64,
+    'snow_1h': np.float64, 'snow_3h': np.float64,
+    'dt': np.int64, 'sys_sunrise': np.int64, 'sys_sunset': np.int64,
+    'timezone': np.int64,
+}
+
+# Columns holding epoch seconds that are stored as local timestamps
+TIMESTAMP_COLUMNS = ('dt', 'sys_sunrise', 'sys_sunset')
+
+def _local_times(seconds):
+    # Same naive local time as datetime.fromtimestamp(), for a whole column
+    return pd.to_datetime(seconds, unit='s', utc=True).tz_convert(tzlocal()).tz_localize(None)
+
+def _uuids(count):
+    # One urandom call for the whole batch instead of one per uuid4()
+    data = os.urandom(16 * count)
+    return [str(uuid.UUID(bytes=data[i:i + 16], version=4)) for i in range(0, 16 * count, 16)]
+
+class WeatherColumns:
+    """
+    Typed column buffers for the weather rows of one cycle.
+
+    The buffers are preallocated for every stop of the cycle and filled in
+    place, the 'weather_data' frame is built from them in one step.
+    """
+
+    def __init__(self, capacity):
+        """
+        Args:
+            capacity (int): Maximum number of rows.
+        """
+
+        self.size = 0
+        self.location_id = np.empty(capacity, dtype=np.int64)
+        self.fetched_at = np.empty(capacity, dtype=np.float64)
+        self.columns = [np.empty(capacity, dtype=COLUMN_DTYPES[column]) for column in _extractor.columns]
+
+    def append(self, processed):
+        """
+        Append one row built by process_weather_data().
+
+        Args:
+            processed (tuple): (location_id, values, fetch time in epoch seconds).
+        """
+
+        location_id, values, fetched_at = processed
+        index = self.size
+        self.location_id[index] = location_id
+        self.fetched_at[index] = fetched_at
+        for column, value in zip(self.columns, values):
+            column[index] = value
+        self.size += 1
+
+    def to_frame(self):
+        """
+        Build the 'weather_data' frame from the filled part of the buffers.
+
+        Returns:
+            pd.DataFrame: Weather data with a fresh weather_id per row.
+        """
+
+        size = self.size
+        data = {'weather_id': _uuids(size), 'location_id': self.location_id[:size]}
+        for name, column in zip(_extractor.columns, self.columns):
+            data[name] = _local_times(column[:size]) if name in TIMESTAMP_COLUMNS else column[:size]
+        data['timestamp'] = _local_times(self.fetched_at[:size])
+        return pd.DataFrame(data, copy=False)
+
+class StopSnapshot:
+    """
+    Local Parquet snapshot of the stops feature view.
+
+    The snapshot is stored together with the id of the last commit of the
+    'stops' feature group it was read at. The view is read again only when
+    the feature group has a newer commit, so a restart starts from the
+    snapshot and unchanged stops are never downloaded twice. If the commits
+    cannot be read, the view is read again every `reload_interval` seconds.
+    """
+
+    def __init__(self, path, reload_interval=3600):
+        """
+        Args:
+            path (str): Path of the Parquet file, the commit id is kept next
+                to it in '<path>.json'.
+            reload_interval (float): Seconds between reads of the view when
+                the commits of the feature group are not available.
+        """
+
+        self.path = path
+        self.meta_path = path + '.json'
+        self.reload_interval = reload_interval
+        self.commits_available = True
+        self.loaded_at = None
+        self.commit_id = None
+        self.frame = None
+        if os.path.exists(self.path) and os.path.exists(self.meta_path):
+            try:
+                with open(self.meta_path, 'r') as file:
+                    self.commit_id = json.load(file)['commit_id']
+                self.frame = pd.read_parquet(self.path)
+                print(f"Loaded {len(self.frame)} stops from snapshot '{self.path}'")
+                sys.stdout.flush()
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring unreadable stop snapshot '{self.path}': {e}")
+                sys.stdout.flush()
+                self.commit_id = None
+                self.frame = None
+
+    def refresh(self, fg_stops, feature_view):
+        """
+        Get the stops, reading the feature view only if the feature group changed.
+
+        Args:
+            fg_stops: The 'stops' feature group.
+            feature_view: Feature view with the stops.
+
+        Returns:
+            pd.DataFrame: Stops with STOP_COLUMNS.
+        """
+
+        commit_id = None
+        if self.commits_available:
+            try:
+                commit_id = max(fg_stops.commit_details(limit=1), default=None)
+            except Exception as e:
+                # Not retried, the view is reloaded on a timer from now on
+                self.commits_available = False
+                print(f"Unable to read commits of the stops feature group, reloading stops every {self.reload_interval}s: {e}")
+                sys.stdout.flush()
+
+        if self.frame is not None:
+            if commit_id is not None:
+                if commit_id == self.commit_id:
+                    return self.frame
+            elif self.loaded_at is not None and time.monotonic() - self.loaded_at < self.reload_interval:
+                return self.frame
+
+        self.frame = feature_view.get_batch_data()[list(STOP_COLUMNS)]
+        self.loaded_at = time.monotonic()
+        self.commit_id = commit_id
+        print(f"Loaded {len(self.frame)} stops from the feature view")
+        sys.stdout.flush()
+        if commit_id is not None:
+            self.save()
+        return self.frame
+
+    def save(self):
+        """
+        Write the snapshot and its commit id, replacing the old files.
+        """
+
+        try:
+            self.frame.to_parquet(self.path + '.tmp', index=False)
+            os.replace(self.path + '.tmp', self.path)
+            with open(self.meta_path + '.tmp', 'w') as file:
+                json.dump({'commit_id': self.commit_id}, file)
+            os.replace(self.meta_path + '.tmp', self.meta_path)
+        except (OSError, ValueError) as e:
+            print(f"Error saving stop snapshot '{self.path}': {e}")
+            sys.stdout.flush()
+
+class WeatherUploader(threading.Thread):
+    """
+    Background thread inserting weather frames into the feature group.
+
+    Frames are queued by the fetch loop and inserted in chunks of up to
+    `chunk_size` rows without waiting for the materialization job, so the
+    next cycle starts right away. The offline materialization is started
+    once every `materialize_every` uploaded frames and when the uploader
+    stops. The queue is bounded: if Hopsworks falls behind, submit() blocks
+    instead of piling up frames in memory. A chunk that fails to insert is
+    retried with backoff until it succeeds; only when the uploader is
+    stopping is it given up after STOP_UPLOAD_ATTEMPTS attempts.
+    """
+
+    def __init__(self, fg_weather, chunk_size=5000, materialize_every=10, queue_size=4):
+        """
+        Args:
+            fg_weather: The 'weather_data' feature group.
+            chunk_size (int): Maximum number of rows per insert.
+            materialize_every (int): Number of frames between materialization runs.
+            queue_size (int): Maximum number of frames waiting for upload.
+        """
+
+        super().__init__(name='weather-uploader', daemon=True)
+        self.fg_weather = fg_weather
+        self.chunk_size = chunk_size
+        self.materialize_every = materialize_every
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.pending = 0
+        self.stopping = threading.Event()
+
+    def submit(self, frame):
+        """
+        Queue a frame for upload, waiting while the queue is full.
+
+        Args:
+            frame (pd.DataFrame): Weather data to insert.
+        """
+
+        if len(frame):
+            self.frames.put(frame)
+
+    def stop(self, timeout=None):
+        """
+        Upload the queued frames, materialize them and stop the thread.
+
+        Args:
+            timeout (float): Seconds to wait for the thread to finish.
+        """
+
+        self.stopping.set()
+        self.frames.put(None)
+        self.join(timeout)
+
+    def materialize(self):
+        """
+        Start the offline materialization job without waiting for it.
+        """
+
+        try:
+            self.fg_weather.materialization_job.run(await_termination=False)
+            self.pending = 0
+        except Exception as e:
+            print(f"Error starting materialization job: {e}")
+            sys.stdout.flush()
+
+    def insert(self, chunk):
+        """
+        Insert one chunk, retrying with backoff until it succeeds.
+
+        Args:
+            chunk (pd.DataFrame): Weather data rows.
+
+        Returns:
+            bool: True if the chunk was inserted, False if it was given up
+            while the uploader is stopping.
+        """
+
+        delay = UPLOAD_RETRY_DELAY
+        attempts_left = STOP_UPLOAD_ATTEMPTS
+        while True:
+            try:
+                self.fg_weather.insert(
+                    chunk,
+                    write_options={'wait_for_job': False, 'start_offline_materialization': False}
+                )
+                return True
+            except Exception as e:
+                if self.stopping.is_set():
+                    attempts_left -= 1
+                    if not attempts_left:
+                        print(f"Error inserting {len(chunk)} weather data rows, dropping them while stopping: {e}")
+                        sys.stdout.flush()
+                        return False
+                print(f"Error inserting {len(chunk)} weather data rows, retrying in {delay}s: {e}")
+                sys.stdout.flush()
+                if self.stopping.is_set():
+                    time.sleep(delay)
+                else:
+                    self.stopping.wait(delay)
+                delay = min(delay * 2, MAX_UPLOAD_RETRY_DELAY)
+
+    def run(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+
+            uploaded = 0
+            for start in range(0, len(frame), self.chunk_size):
+                chunk = frame.iloc[start:start + self.chunk_size]
+                if self.insert(chunk):
+                    uploaded += len(chunk)
+            print(f"Uploaded {uploaded} of {len(frame)} weather data rows")
+            sys.stdout.flush()
+
+            self.pending += 1
+            if self.pending >= self.materialize_every:
+                self.materialize()
+
+        if self.pending:
+            self.materialize()
 
 def load_config(filename):
     """
@@ -40,80 +363,64 @@ def call_weather_api(lat, lon, api_key):
         api_key (str): API key for accessing the OpenWeatherMap API.
 
     Returns:
-        dict: Weather data in JSON format.
+        bytes: Weather data as a raw JSON response.
     """
     
     url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
     try:
-        response = requests.get(url)
+        response = http_client.get(url, provider='openweathermap')
         response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
-        data = response.json()
-        return data
+        return response.content
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data: {e}")
         sys.stdout.flush()
         return None
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON response: {e}")
-        sys.stdout.flush()
-        return None
 
-def process_weather_data(stop_data, api_key):
+def fetch_stop_weather(stop, api_key):
     """
-    Process weather data for a given bus stop.
+    Fetch weather data for a given bus stop.
 
     Args:
-        stop_data (dict): Dictionary containing bus stop data.
+        stop (tuple): Values of STOP_COLUMNS for the bus stop.
         api_key (str): API key for accessing the OpenWeatherMap API.
 
     Returns:
-        dict: Processed weather data.
+        tuple: (stop, raw JSON response), None if the stop has no coordinates.
     """
-    lat = stop_data['zemepisna_sirka']
-    lon = stop_data['zemepisna_dlzka']
-    town = stop_data['obec']
-    stop_name = stop_data['nazov_zastavky']
+    _, lat, lon, town, stop_name = stop
 
     if lat == 0 or lon == 0:
         print(f"Ignoring row for bus stop {town}, {stop_name}: Latitude or longitude is zero.")
         return None
 
-    weather_data = call_weather_api(lat, lon, api_key)
+    return stop, call_weather_api(lat, lon, api_key)
+
+def process_weather_data(fetched):
+    """
+    Process weather data for a given bus stop.
+
+    Args:
+        fetched (tuple): (stop, weather_data) returned by fetch_stop_weather().
+
+    Returns:
+        tuple: (location_id, values in the order of the extractor columns,
+        fetch time in epoch seconds), see WeatherColumns.append().
+    """
+    (location_id, _, _, town, stop_name), weather_data = fetched
+
     if weather_data:
         try:
-            relevant_data = {
-                'weather_id': str(uuid.uuid4()),  # generate unique uuid
-                'location_id': stop_data['cislo_zastavky'],
-                'weather': weather_data['weather'],
-                'main_temp': weather_data['main']['temp'],
-                'main_feels_like': weather_data['main']['feels_like'],
-                'main_temp_min': weather_data['main']['temp_min'],
-                'main_temp_max': weather_data['main']['temp_max'],
-                'main_pressure': weather_data['main']['pressure'],
-                'main_humidity': weather_data['main']['humidity'],
-                'main_sea_level': weather_data['main'].get('sea_level', 0),
-                'main_grnd_level': weather_data['main'].get('grnd_level', 0),
-                'visibility': weather_data.get('visibility', 0),
-                'wind_speed': weather_data['wind']['speed'],
-                'wind_deg': weather_data['wind']['deg'],
-                'wind_gust': weather_data.get('wind').get('gust', 0),
-                'clouds_all': weather_data['clouds']['all'],
-                'rain_1h': weather_data.get('rain', {}).get('1h', 0),
-                'rain_3h': weather_data.get('rain', {}).get('3h', 0),
-                'snow_1h': weather_data.get('snow', {}).get('1h', 0),
-                'snow_3h': weather_data.get('snow', {}).get('3h', 0),
-                'dt': datetime.fromtimestamp(weather_data['dt']),
-                'timestamp': datetime.now(),
-                'sys_sunrise': datetime.fromtimestamp(weather_data['sys']['sunrise']),
-                'sys_sunset': datetime.fromtimestamp(weather_data['sys']['sunset']),
-                'timezone': weather_data['timezone']
-            }
+            processed = (location_id, _extractor.from_json(weather_data), time.time())
             print(f"Weather data for {town}, {stop_name} fetched successfully.")
-            return relevant_data
+            return processed
         except KeyError as e:
             print(f"KeyError: {e}")
             sys.stdout.flush()
             return None
+        except ValueError as e:
+            print(f"Error decoding JSON response: {e}")
+            sys.stdout.flush()
+            return None
     else:
         print(f"Failed to fetch weather forecast for bus stop {town}, {stop_name}.")
         sys.stdout.flush()
@@ -124,8 +431,15 @@ def main():
     if config is None:
         return
 
+    http_client.configure(config)
     delay = config.get('delay', 3600)
+    scheduler = Scheduler(delay, config.get('spread', 0.8))
+    refresh_plan = RefreshPlan.load(config['refresh_tiers'], delay) if config.get('refresh_tiers') else None
     api_key = config.get('api_key')
+    concurrency = config.get('concurrency', 1)
+    queue_size = config.get('queue_size', 256)
+    snapshot = StopSnapshot(config.get('stops_snapshot', 'stops.parquet'), config.get('stops_reload_interval', 3600))
+    upload = config.get('upload', {})
     
     # login to Hopsworks
     project = hopsworks.login()
@@ -139,6 +453,12 @@ def main():
         version=1
     )
     
+    # get stops feature group, its commits tell when the feature view changed
+    fg_stops = fs.get_feature_group(
+        name='stops',
+        version=1
+    )
+    
     # get or create weather data feature group
     fg_weather = fs.get_or_create_feature_group(
         name="weather_data",
@@ -149,36 +469,52 @@ def main():
         event_time="timestamp",
     )
     
+    uploader = WeatherUploader(
+        fg_weather,
+        upload.get('chunk_size', 5000),
+        upload.get('materialize_every', 10),
+        upload.get('queue_size', 4)
+    )
+    uploader.start()
+    
     try:
         while True:
-            #get data from feature view, save to dataframe
-            df_stops = feature_view_stops.get_batch_data()
+            scheduler.wait()
             
-            weather_data_list = []
+            #get data from feature view, or from the local snapshot if the stops did not change
+            df_stops = snapshot.refresh(fg_stops, feature_view_stops)
             
-            for index, row in df_stops.iterrows():
-                stop_data = {
-                    'cislo_zastavky': row['cislo_zastavky'],
-                    'zemepisna_sirka': row['zemepisna_sirka'],
-                    'zemepisna_dlzka': row['zemepisna_dlzka'],
-                    'obec': row['obec'],
-                    'nazov_zastavky': row['nazov_zastavky']
-                }
-                
-                weather_data = process_weather_data(stop_data, api_key)
-                if weather_data:
-                    weather_data_list.append(weather_data)
+            stops = list(zip(*(df_stops[column].to_numpy() for column in STOP_COLUMNS)))
+            if refresh_plan is not None:
+                # only the stops whose refresh tier is due in this cycle
+                stops = refresh_plan.due(stops, lambda stop: (stop[0],))
             
-            # create dataframe with weather data
-            df_weather = pd.DataFrame(weather_data_list)
+            # fetch, process and collect the weather data in overlapping stages
+            weather_columns = WeatherColumns(len(stops))
+
+            def collect(processed):
+                weather_columns.append(processed)
+                if refresh_plan is not None:
+                    # stops that failed stay due for the next cycle
+                    refresh_plan.mark_fetched((processed[0],))
+
+            stats = Pipeline([
+                Stage('fetch', partial(fetch_stop_weather, api_key=api_key), concurrency, queue_size),
+                Stage('process', process_weather_data, 1, queue_size),
+                Stage('collect', collect, 1, queue_size),
+            ]).run(scheduler.paced(stops))
+            report(stats)
             
-            fg_weather.insert(df_weather)
+            # create dataframe with weather data
+            df_weather = weather_columns.to_frame()
             
-            print(f"Sleeping for {delay}s")            
-            time.sleep(delay)               
+            # upload in the background while the next cycle fetches
+            uploader.submit(df_weather)
     except Exception as e:
         print(f"Error: {e}")
         sys.stdout.flush()
+    finally:
+        uploader.stop()
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,14 @@
 import csv
 import json
+import os
+import sys
 import hopsworks
-import requests
 import pandas as pd
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.centroids import fill_missing_coordinates
+from common.geocoding import Geocoder, place_name
+
 def load_config(filename):
     """
     Load configuration settings from a JSON file.
@@ -22,28 +27,6 @@ def load_config(filename):
         print(f"Config file '{filename}' not found.")
         return None
         
-def get_coordinates(place_name):
-    """
-    Get coordinates (latitude, longitude) for a given place name using OpenStreetMap API.
-
-    Args:
-        place_name (str): The name of the place to search for.
-
-    Returns:
-        tuple: A tuple containing latitude and longitude, or (0, 0) if not found.
-    """
-    try:
-        url = f"https://nominatim.openstreetmap.org/search?q={place_name}&format=json"
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            if data:
-                print(f"Fetched missing coordinates for '{place_name}'")
-                return float(data[0]['lat']), float(data[0]['lon'])
-    except Exception as e:
-        print(f"Error retrieving coordinates for '{place_name}': {e}")
-    return 0, 0
-
 def main():
     config = load_config('config.json')
     if config is None:
@@ -61,12 +44,16 @@ def main():
     # Load the CSV file into a pandas DataFrame
     df = pd.read_csv(file_path, delimiter=delimiter, decimal=",", keep_default_na=False)
     
-    # Check for missing coordinates and fetch if necessary
-    for index, row in df.iterrows():
-        if row['zemepisna_sirka'] == 0 and row['zemepisna_dlzka'] == 0:
-            lat, lon = get_coordinates(row['obec'] + ", " + str(row['nazov_zastavky']).replace(',', '.'))
-            df.at[index, 'zemepisna_sirka'] = lat
-            df.at[index, 'zemepisna_dlzka'] = lon
+    # Fill missing coordinates from the town of the stop, fetch the rest if necessary
+    filled = fill_missing_coordinates(df, 'zemepisna_sirka', 'zemepisna_dlzka', 'obec', 'cast_obce')
+    print(f"Filled coordinates of {filled} stops from town centroids")
+    missing = (df['zemepisna_sirka'] == 0) & (df['zemepisna_dlzka'] == 0)
+    if missing.any():
+        places = [place_name(town, stop_name) for town, stop_name in zip(df.loc[missing, 'obec'], df.loc[missing, 'nazov_zastavky'])]
+        coordinates = Geocoder.from_config(config).geocode_many(places)
+        for index, place in zip(df.index[missing], places):
+            if coordinates[place] is not None:
+                df.loc[index, ['zemepisna_sirka', 'zemepisna_dlzka']] = coordinates[place]
     
     # Get or create the 'stops' feature group
     stops_fg = fs.get_or_create_feature_group(
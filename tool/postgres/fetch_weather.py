@@ -1,9 +1,23 @@
 import requests
 import psycopg2
-from datetime import datetime
 import json
+import os
 import time
 import sys
+from functools import partial
+from operator import itemgetter
+from datetime import date
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common import extract, http_client, providers, rate_limit
+from common.pipeline import Pipeline, Stage, report
+from common.refresh import RefreshPlan
+from common.scheduler import Scheduler
+from schema import create_weather_table, ensure_weather_partitions, month_start
+from weather_writer import WeatherDataWriter
+from spool import Spool, SpoolWriter, SpoolDrainer
+from stop_catalogue import StopCatalogue
+from weather_service import LatestWeatherCache, WeatherService
 
 def load_config(filename):
     """
@@ -50,166 +64,222 @@ def connect_to_database(config):
         sys.stdout.flush()
         return None
 
-def create_weather_table(conn):
+def call_weather_api(lat, lon, api_key):
     """
-    Create the 'WeatherData' table in the database if it doesn't exist.
+    Call the OpenWeatherMap API to fetch weather data.
 
     Args:
-        conn (psycopg2.connection): Connection object to the PostgreSQL database.
+        lat (float): Latitude of the location.
+        lon (float): Longitude of the location.
+        api_key (str): API key for accessing the OpenWeatherMap API.
+
+    Returns:
+        bytes: Weather data as a raw JSON response.
     """
     
+    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
     try:
-        # Create the table
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS WeatherData (
-                    weather_id SERIAL PRIMARY KEY,
-                    location_id INT REFERENCES Locations(stop_id),
-                    weather JSONB,
-                    main_temp DECIMAL,
-                    main_feels_like DECIMAL,
-                    main_temp_min DECIMAL,
-                    main_temp_max DECIMAL,
-                    main_pressure INT,
-                    main_humidity INT,
-                    main_sea_level INT,
-                    main_grnd_level INT,
-                    visibility INT,
-                    wind_speed DECIMAL,
-                    wind_deg INT,
-                    wind_gust DECIMAL,
-                    clouds_all INT,
-                    rain_1h DECIMAL,
-                    rain_3h DECIMAL,
-                    snow_1h DECIMAL,
-                    snow_3h DECIMAL,
-                    dt TIMESTAMP,
-                    sys_sunrise TIMESTAMP,
-                    sys_sunset TIMESTAMP,
-                    timezone INT
-                )
-                """
-            )
-        conn.commit()
-        print("Table 'WeatherData' created successfully")
-        sys.stdout.flush()
-    except psycopg2.Error as e:
-        print(f"Error creating table: {e}")
+        response = http_client.get(url, provider='openweathermap')
+        response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
+        return response.content
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching data: {e}")
         sys.stdout.flush()
+        return None
 
-def insert_weather_data(conn, location_id, weather_data):
+def call_weather_api_hedged(lat, lon, hedge_providers, provider_configs, latency_budget):
     """
-    Insert weather data into the 'WeatherData' table.
+    Fetch weather data, falling back to other providers when one is slow.
 
     Args:
-        conn (psycopg2.connection): Connection object to the PostgreSQL database.
-        location_id (int): ID of the location.
-        weather_data (dict): Weather data to be inserted.
+        lat (float): Latitude of the location.
+        lon (float): Longitude of the location.
+        hedge_providers (list): Provider names in order of preference.
+        provider_configs (dict): Settings of each provider, keyed by name.
+        latency_budget (float): Seconds to wait before asking the next provider.
+
+    Returns:
+        dict: Weather data in the OpenWeatherMap format, None if all failed.
     """
     
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute(
-                """
-                INSERT INTO WeatherData (
-                    location_id, weather, main_temp, main_feels_like,
-                    main_temp_min, main_temp_max, main_pressure, main_humidity,
-                    main_sea_level, main_grnd_level, visibility, wind_speed,
-                    wind_deg, wind_gust, clouds_all, rain_1h, rain_3h,
-                    snow_1h, snow_3h, dt, sys_sunrise, sys_sunset, timezone
-                )
-                VALUES (
-                    %s, %s::jsonb, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,
-                    %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                )
-                """,
-                (
-                    location_id, json.dumps(weather_data.get('weather')),
-                    weather_data.get('main', {}).get('temp'), weather_data.get('main', {}).get('feels_like'),
-                    weather_data.get('main', {}).get('temp_min'), weather_data.get('main', {}).get('temp_max'),
-                    weather_data.get('main', {}).get('pressure'), weather_data.get('main', {}).get('humidity'),
-                    weather_data.get('main', {}).get('sea_level'), weather_data.get('main', {}).get('grnd_level'),
-                    weather_data.get('visibility'), weather_data.get('wind', {}).get('speed'),
-                    weather_data.get('wind', {}).get('deg'), weather_data.get('wind', {}).get('gust'),
-                    weather_data.get('clouds', {}).get('all'), weather_data.get('rain', {}).get('1h'),
-                    weather_data.get('rain', {}).get('3h'), weather_data.get('snow', {}).get('1h'),
-                    weather_data.get('snow', {}).get('3h'),
-                    datetime.fromtimestamp(weather_data.get('dt')),
-                    datetime.fromtimestamp(weather_data.get('sys', {}).get('sunrise')),
-                    datetime.fromtimestamp(weather_data.get('sys', {}).get('sunset')),
-                    weather_data.get('timezone')
-                )
-            )
-        conn.commit()
-        print("Weather data inserted successfully")
-    except psycopg2.Error as e:
-        print(f"Error inserting weather data: {e}")
-        sys.stdout.flush()
+    provider, weather_data = providers.fetch_hedged(lat, lon, hedge_providers, provider_configs, latency_budget)
+    if provider is not None and provider != hedge_providers[0]:
+        print(f"Weather data for {lat}, {lon} answered by {provider}")
+    return weather_data
 
-def call_weather_api(lat, lon, api_key):
+def parse_weather_data(fetched):
     """
-    Call the OpenWeatherMap API to fetch weather data.
+    Decode a fetched response and fan it out to the stops of its target.
 
     Args:
-        lat (float): Latitude of the location.
-        lon (float): Longitude of the location.
-        api_key (str): API key for accessing the OpenWeatherMap API.
+        fetched (tuple): (target, payload) where target is a
+            (stop_ids, lat, lon, name) tuple and payload the raw JSON
+            response, already decoded weather data, or None if the fetch failed.
 
     Returns:
-        dict: Weather data in JSON format.
+        list: List of (stop_id, weather_data) observations, None if the fetch failed.
     """
     
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={api_key}&units=metric"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  # Raise an exception for 4xx and 5xx status codes
-        data = response.json()
-        return data
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching data: {e}")
+    (stop_ids, _, _, name), payload = fetched
+    if not payload:
+        print(f"Failed to fetch weather forecast for bus stop {name}.")
         sys.stdout.flush()
         return None
 
+    weather_data = extract.loads(payload) if isinstance(payload, bytes) else payload
+    return [(stop_id, weather_data) for stop_id in stop_ids]
+
+def run_cycle(writer, targets, fetch, fetch_workers=1, parse_workers=1, queue_size=256, refresh_plan=None):
+    """
+    Fetch, parse and write one cycle of bus stops as an overlapping pipeline.
+
+    The fetch, parse and write stages run in their own threads and pass work
+    through bounded queues, so the network and the database are busy at the
+    same time. When the writer falls behind, the queues fill up and fetching
+    slows down.
+
+    Args:
+        writer (WeatherDataWriter): Writer collecting the observations.
+        targets (iterable): (stop_ids, lat, lon, name) fetch targets.
+        fetch (callable): Function taking (lat, lon) and returning weather data.
+        fetch_workers (int): Number of simultaneous API calls.
+        parse_workers (int): Number of threads decoding responses.
+        queue_size (int): Capacity of the queue in front of each stage.
+        refresh_plan (RefreshPlan): Plan to mark the written targets in, if any.
+
+    Returns:
+        dict: Statistics per stage, see Pipeline.run().
+
+    Raises:
+        psycopg2.Error: If writing failed, the rest of the cycle is skipped.
+    """
+    
+    def fetch_target(target):
+        _, lat, lon, _ = target
+        return target, fetch(lat, lon)
+
+    def write_observations(observations):
+        for stop_id, weather_data in observations:
+            writer.add(stop_id, weather_data)
+        if refresh_plan is not None:
+            refresh_plan.mark_fetched(stop_id for stop_id, _ in observations)
+
+    return Pipeline([
+        Stage('fetch', fetch_target, fetch_workers, queue_size),
+        Stage('parse', parse_weather_data, parse_workers, queue_size),
+        Stage('write', write_observations, 1, queue_size, fatal=(psycopg2.Error,)),
+    ]).run(targets)
+
 def main():
     config = load_config('config.json')
     if config is None:
         return
 
+    http_client.configure(config)
     delay = config.get('delay', 3600)
+    scheduler = Scheduler(delay, config.get('spread', 0.8))
+    refresh_plan = RefreshPlan.load(config['refresh_tiers'], delay) if config.get('refresh_tiers') else None
     api_key = config.get('api_key')
+    concurrency = config.get('concurrency', 1)
+    parse_workers = config.get('parse_workers', 1)
+    queue_size = config.get('queue_size', 256)
+    batch_size = config.get('batch_size', 500)
+    flush_interval = config.get('flush_interval', 30)
+    # Opt-in: fetch once per grid cell of this many decimal places instead of per stop
+    grid_precision = config.get('grid_precision')
+    partition_months_ahead = config.get('partition_months_ahead', 2)
+    compact = config.get('storage') == 'compact'
+    hedging = config.get('hedging')
+
+    if hedging:
+        provider_configs = {'openweathermap': {'api_key': api_key}, **config.get('providers', {})}
+        fetch = partial(call_weather_api_hedged, hedge_providers=hedging['providers'],
+                        provider_configs=provider_configs, latency_budget=hedging.get('latency_budget', 2.0))
+    else:
+        fetch = partial(call_weather_api, api_key=api_key)
+    spool_path = config.get('spool_path')
     conn = connect_to_database(config)
 
     if conn is not None:
-        create_weather_table(conn)
+        create_weather_table(conn, compact)
+
+        latest = None
+        service_config = config.get('service')
+        if service_config:
+            # Serve the latest observation per stop, fed by this fetcher
+            latest = LatestWeatherCache(compact)
+            try:
+                print(f"Loaded latest weather of {latest.load(conn)} stops")
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"Error loading latest weather: {e}")
+            sys.stdout.flush()
+            WeatherService(latest, service_config.get('host', '127.0.0.1'), service_config.get('port', 8080)).start_in_thread()
+        catalogue = StopCatalogue()
+        partitions_month = None
+
+        if spool_path:
+            # Observations go to a local spool, a background thread writes them to the database
+            spool = Spool(spool_path)
+            drainer = SpoolDrainer(spool, partial(connect_to_database, config), batch_size, flush_interval, compact, latest)
+            drainer.start()
+            writer = SpoolWriter(spool, drainer, batch_size)
+        else:
+            writer = WeatherDataWriter(conn, batch_size, flush_interval, compact, latest)
 
         try:
             while True:
-                with conn.cursor() as cursor:
-                    cursor.execute("SELECT * FROM Locations") # Fetch all locations from the database
-                    rows = cursor.fetchall()
-
-                    for row in rows:
-                        stop_id, lat, lon, _, _, _, _, stop_name = row
-
-                        if lat == 0 or lon == 0:
-                            print(f"Ignoring row for bus stop {stop_name}: Latitude or longitude is zero.")
-                            continue
-
-                        weather_data = call_weather_api(lat, lon, api_key)
-
-                        if weather_data:
-                            insert_weather_data(conn, stop_id, weather_data)
-                        else:
-                            print(f"Failed to fetch weather forecast for bus stop {stop_name}.")
-                            sys.stdout.flush()
-                print(f"Sleeping for {delay}s")            
-                time.sleep(delay)               
-        except psycopg2.Error as e:
-            print(f"Error executing SQL query: {e}")
-            sys.stdout.flush()
+                scheduler.wait()
+                try:
+                    if conn is None:
+                        conn = connect_to_database(config)
+                        if not spool_path:
+                            writer.conn = conn
+
+                    if conn is not None:
+                        if partitions_month != month_start(date.today()):
+                            partitions_month = ensure_weather_partitions(conn, partition_months_ahead)
+                        catalogue.refresh(conn)
+                except psycopg2.Error as e:
+                    print(f"Error executing SQL query: {e}")
+                    sys.stdout.flush()
+                    conn.close()
+                    conn = None
+
+                if conn is None and not spool_path:
+                    print("Database unavailable, skipping this cycle")
+                    sys.stdout.flush()
+                    continue
+
+                targets = catalogue.targets(grid_precision)
+                if refresh_plan is not None:
+                    # Only the stops whose refresh tier is due in this cycle
+                    targets = refresh_plan.due(targets, itemgetter(0))
+
+                quota = rate_limit.requests_per_period('openweathermap', delay)
+                if quota is not None and quota < len(targets):
+                    print(f"Rate limit allows {quota:.0f} requests per {delay}s for {len(targets)} requests, the cycle will overrun")
+                    sys.stdout.flush()
+
+                cycle_start = time.monotonic()
+                try:
+                    stats = run_cycle(writer, scheduler.paced(targets), fetch, concurrency, parse_workers, queue_size, refresh_plan)
+                    writer.flush()
+                    report(stats)
+                except psycopg2.Error as e:
+                    print(f"Error writing to the database, observations of this cycle are lost: {e}")
+                    sys.stdout.flush()
+                    conn.close()
+                    conn = None
+                print(f"Fetched {sum(len(target[0]) for target in targets)} stops with {len(targets)} requests in {time.monotonic() - cycle_start:.1f}s")
+                inserted, duplicates = writer.cycle_stats()
+                print(f"Stored {inserted} new observations, skipped {duplicates} duplicates")
         finally:
-            conn.close()
+            if spool_path:
+                writer.flush()
+                drainer.stop()
+            if conn is not None:
+                conn.close()
     else:
         print("Unable to connect to the database")
         sys.stdout.flush()
@@ -1,7 +1,26 @@
 import csv
+import io
 import json
+import os
+import sys
+import pandas as pd
 import psycopg2
-import requests
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.centroids import fill_missing_coordinates
+from common.geocoding import Geocoder, place_name
+
+# CSV header of each 'Locations' column
+LOCATION_COLUMNS = {
+    'Cislo zastavky': 'stop_id',
+    'Zemepisna sirka': 'latitude',
+    'Zemepisna dlzka': 'longitude',
+    'Stat': 'state',
+    'Okres': 'region',
+    'Obec': 'town',
+    'Cast obce': 'town_part',
+    'Nazov zastavky': 'stop_name'
+}
 
 def load_config(filename):
     """
@@ -133,31 +152,35 @@ def create_table(conn):
         conn.rollback()
         print(f"Error creating table: {e}")
         
-def get_coordinates(place_name):
+def read_locations(file_path):
     """
-    Get coordinates (latitude, longitude) for a given place name using OpenStreetMap API.
+    Read the stops CSV file into a frame with the 'Locations' columns.
 
     Args:
-        place_name (str): The name of the place to search for.
+        file_path (str): Path of the ';' separated CSV file with comma decimals.
 
     Returns:
-        tuple: A tuple containing latitude and longitude, or (0, 0) if not found.
+        pd.DataFrame: One row per stop id, the last one wins for duplicates.
     """
-    try:
-        url = f"https://nominatim.openstreetmap.org/search?q={place_name}&format=json"
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            if data:
-                print(f"Fetched missing coordinates for '{place_name}'")
-                return float(data[0]['lat']), float(data[0]['lon'])
-    except Exception as e:
-        print(f"Error retrieving coordinates for '{place_name}': {e}")
-    return 0, 0
+
+    df = pd.read_csv(
+        file_path, delimiter=';', decimal=',', keep_default_na=False,
+        dtype={'Cislo zastavky': 'int64', 'Zemepisna sirka': 'float64', 'Zemepisna dlzka': 'float64',
+               'Stat': str, 'Okres': str, 'Obec': str, 'Cast obce': str, 'Nazov zastavky': str}
+    )
+    df = df.rename(columns=LOCATION_COLUMNS)[list(LOCATION_COLUMNS.values())]
+    return df.drop_duplicates('stop_id', keep='last')
 
 def fill_table(conn, config):
     """
-    Fill the 'Locations' table with data from a CSV file.
+    Load the stops CSV file into the 'Locations' table.
+
+    The file is copied into a temporary table in one COPY and merged into
+    'Locations' with a single upsert: new stops are inserted, and stops whose
+    coordinates or names changed are updated. Missing coordinates (0, 0) in
+    the file never overwrite coordinates that are already stored. New stops
+    without coordinates get the centroid of their town part or town, and
+    only stops in towns without any known stop are geocoded.
 
     Args:
         conn (psycopg2.connection): Connection object to the PostgreSQL database.
@@ -165,39 +188,69 @@ def fill_table(conn, config):
     """
     
     try:
-        # Open the CSV file
-        with open(config['location_data'], newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=';')
-
-            # Get existing stops from the database
-            existing_stops = set()
-            with conn.cursor() as cursor:
-                cursor.execute("SELECT stop_id FROM Locations")
-                rows = cursor.fetchall()
-                existing_stops.update(row[0] for row in rows)
-
-            # Insert new stops into the table
-            with conn.cursor() as cursor:
-                for row in reader:
-                    stop_id = int(row['Cislo zastavky'])
-                    if stop_id not in existing_stops:
-                        latitude = float(row['Zemepisna sirka'].replace(',', '.'))
-                        longitude = float(row['Zemepisna dlzka'].replace(',', '.'))
-                        if latitude == 0.0 and longitude == 0.0:  # If coordinates are missing
-                            place_name = row['Obec'] + ", " + row['Nazov zastavky'].replace(',', '.')
-                            latitude, longitude = get_coordinates(place_name)
-                        cursor.execute(
-                            """
-                            INSERT INTO Locations (stop_id, latitude, longitude, state, region, town, town_part, stop_name)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                            """,
-                            (stop_id, latitude, longitude, row['Stat'], row['Okres'], row['Obec'], row['Cast obce'], row['Nazov zastavky'])
-                        )
-            conn.commit()
-            print("Data inserted into table 'Locations'")
-    except (psycopg2.Error, FileNotFoundError) as e:
+        df = read_locations(config['location_data'])
+
+        # Get existing stops from the database
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT stop_id FROM Locations")
+            existing_stops = {row[0] for row in cursor.fetchall()}
+
+        # Fill missing coordinates of new stops from their town, geocode the rest
+        new_stops = ~df['stop_id'].isin(existing_stops)
+        filled = fill_missing_coordinates(df, 'latitude', 'longitude', 'town', 'town_part', new_stops)
+        if filled:
+            print(f"Filled coordinates of {filled} new stops from town centroids")
+        missing = (df['latitude'] == 0) & (df['longitude'] == 0) & new_stops
+        if missing.any():
+            places = [place_name(town, stop_name) for town, stop_name in zip(df.loc[missing, 'town'], df.loc[missing, 'stop_name'])]
+            coordinates = Geocoder.from_config(config).geocode_many(places)
+            for index, place in zip(df.index[missing], places):
+                if coordinates[place] is not None:
+                    df.loc[index, ['latitude', 'longitude']] = coordinates[place]
+
+        # Strings are quoted so empty names stay empty strings instead of NULL
+        buffer = io.StringIO()
+        df.to_csv(buffer, header=False, index=False, quoting=csv.QUOTE_NONNUMERIC)
+        buffer.seek(0)
+
+        columns = ', '.join(LOCATION_COLUMNS.values())
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE TEMP TABLE locations_load (LIKE Locations) ON COMMIT DROP")
+            cursor.copy_expert(f"COPY locations_load ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+            cursor.execute(
+                f"""
+                INSERT INTO Locations ({columns})
+                SELECT {columns} FROM locations_load
+                ON CONFLICT (stop_id) DO UPDATE SET
+                    latitude = CASE WHEN EXCLUDED.latitude = 0 AND EXCLUDED.longitude = 0
+                                    THEN Locations.latitude ELSE EXCLUDED.latitude END,
+                    longitude = CASE WHEN EXCLUDED.latitude = 0 AND EXCLUDED.longitude = 0
+                                     THEN Locations.longitude ELSE EXCLUDED.longitude END,
+                    state = EXCLUDED.state,
+                    region = EXCLUDED.region,
+                    town = EXCLUDED.town,
+                    town_part = EXCLUDED.town_part,
+                    stop_name = EXCLUDED.stop_name
+                WHERE ((EXCLUDED.latitude <> 0 OR EXCLUDED.longitude <> 0)
+                       AND (Locations.latitude, Locations.longitude)
+                           IS DISTINCT FROM (EXCLUDED.latitude, EXCLUDED.longitude))
+                   OR (Locations.state, Locations.region, Locations.town, Locations.town_part, Locations.stop_name)
+                      IS DISTINCT FROM (EXCLUDED.state, EXCLUDED.region, EXCLUDED.town, EXCLUDED.town_part, EXCLUDED.stop_name)
+                RETURNING xmax = 0
+                """
+            )
+            # xmax is 0 for inserted rows and set for updated ones
+            changed = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+
+        inserted = sum(changed)
+        updated = len(changed) - inserted
+        print(f"Loaded {len(df)} stops into table 'Locations': {inserted} inserted, "
+              f"{updated} updated, {len(df) - len(changed)} unchanged")
+    except (psycopg2.Error, OSError, ValueError) as e:
         conn.rollback()
         print(f"Error filling table: {e}")
+
 def main():
     config = load_config('config.json')
     if config is None:
@@ -0,0 +1,231 @@
+import sys
+from datetime import date
+
+import psycopg2
+from psycopg2 import sql
+
+WEATHER_TABLE = """
+    CREATE TABLE IF NOT EXISTS WeatherData (
+        weather_id SERIAL,
+        location_id INT REFERENCES Locations(stop_id),
+        weather JSONB,
+        main_temp DECIMAL,
+        main_feels_like DECIMAL,
+        main_temp_min DECIMAL,
+        main_temp_max DECIMAL,
+        main_pressure INT,
+        main_humidity INT,
+        main_sea_level INT,
+        main_grnd_level INT,
+        visibility INT,
+        wind_speed DECIMAL,
+        wind_deg INT,
+        wind_gust DECIMAL,
+        clouds_all INT,
+        rain_1h DECIMAL,
+        rain_3h DECIMAL,
+        snow_1h DECIMAL,
+        snow_3h DECIMAL,
+        dt TIMESTAMP NOT NULL,
+        sys_sunrise TIMESTAMP,
+        sys_sunset TIMESTAMP,
+        timezone INT,
+        PRIMARY KEY (weather_id, dt)
+    ) PARTITION BY RANGE (dt)
+"""
+
+WEATHER_CONDITIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS weather_conditions (
+        condition_id SMALLINT PRIMARY KEY,
+        main VARCHAR(50),
+        description VARCHAR(100)
+    )
+"""
+
+COMPACT_WEATHER_TABLE = """
+    CREATE TABLE IF NOT EXISTS WeatherData (
+        weather_id SERIAL,
+        location_id INT REFERENCES Locations(stop_id),
+        weather_ids SMALLINT[],
+        main_temp REAL,
+        main_feels_like REAL,
+        main_temp_min REAL,
+        main_temp_max REAL,
+        main_pressure SMALLINT,
+        main_humidity SMALLINT,
+        main_sea_level INT,
+        main_grnd_level INT,
+        visibility INT,
+        wind_speed REAL,
+        wind_deg SMALLINT,
+        wind_gust REAL,
+        clouds_all SMALLINT,
+        rain_1h REAL,
+        rain_3h REAL,
+        snow_1h REAL,
+        snow_3h REAL,
+        dt TIMESTAMP NOT NULL,
+        sys_sunrise TIMESTAMP,
+        sys_sunset TIMESTAMP,
+        timezone INT,
+        PRIMARY KEY (weather_id, dt)
+    ) PARTITION BY RANGE (dt)
+"""
+
+WEATHER_LATEST_TABLE = """
+    CREATE TABLE IF NOT EXISTS WeatherLatest (
+        LIKE WeatherData,
+        PRIMARY KEY (location_id)
+    )
+"""
+
+BACKFILL_WEATHER_LATEST = """
+    INSERT INTO WeatherLatest
+    SELECT DISTINCT ON (location_id) * FROM WeatherData
+    ORDER BY location_id, dt DESC
+"""
+
+def create_weather_table(conn, compact=False):
+    """
+    Create the 'WeatherData' table in the database if it doesn't exist.
+
+    The table is range partitioned by month on 'dt', with a unique index on
+    (location_id, dt) that serves per-stop history and rejects repeated
+    observations, and a BRIN index on 'dt' for time range scans.
+
+    'WeatherLatest' has the same columns and holds the latest observation of
+    every stop. It is filled from 'WeatherData' when it is created and kept
+    up to date by insert_weather_rows().
+
+    The compact layout stores the condition ids of each observation as a
+    SMALLINT array referring to 'weather_conditions' instead of the weather
+    JSON, and uses fixed-width REAL/SMALLINT/INT columns, INT where values
+    such as visibility in metres exceed 32767. The layout is chosen
+    when the table is created.
+
+    Args:
+        conn (psycopg2.connection): Connection object to the PostgreSQL database.
+        compact (bool): Create the compact layout.
+    """
+
+    try:
+        # Create the table
+        with conn.cursor() as cursor:
+            if compact:
+                cursor.execute(WEATHER_CONDITIONS_TABLE)
+                cursor.execute(COMPACT_WEATHER_TABLE)
+            else:
+                cursor.execute(WEATHER_TABLE)
+            cursor.execute("CREATE INDEX IF NOT EXISTS weatherdata_dt_brin ON WeatherData USING BRIN (dt)")
+        conn.commit()
+        print("Table 'WeatherData' created successfully")
+        sys.stdout.flush()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error creating table: {e}")
+        sys.stdout.flush()
+        return
+
+    try:
+        # One observation per stop and provider timestamp
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS weatherdata_location_dt_key ON WeatherData (location_id, dt)"
+            )
+            cursor.execute("DROP INDEX IF EXISTS weatherdata_location_dt")
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error creating unique key on (location_id, dt), remove duplicate observations first: {e}")
+        sys.stdout.flush()
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('weatherlatest') IS NULL")
+            missing = cursor.fetchone()[0]
+            cursor.execute(WEATHER_LATEST_TABLE)
+            if missing:
+                cursor.execute(BACKFILL_WEATHER_LATEST)
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error creating table 'WeatherLatest': {e}")
+        sys.stdout.flush()
+
+def is_partitioned(conn):
+    """
+    Check if the 'WeatherData' table is partitioned.
+
+    Tables created before partitioning was introduced stay plain tables
+    until they are migrated by hand.
+
+    Args:
+        conn (psycopg2.connection): Connection object to the PostgreSQL database.
+
+    Returns:
+        bool: True if the table is partitioned, False otherwise.
+    """
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'weatherdata'::regclass")
+        partitioned = cursor.fetchone() is not None
+    conn.commit()
+    return partitioned
+
+def month_start(day, offset=0):
+    """
+    Get the first day of the month `offset` months after the month of `day`.
+
+    Args:
+        day (date): Any day of the base month.
+        offset (int): Number of months to move forward.
+
+    Returns:
+        date: First day of the resulting month.
+    """
+
+    months = day.year * 12 + day.month - 1 + offset
+    return date(months // 12, months % 12 + 1, 1)
+
+def ensure_weather_partitions(conn, months_ahead=2, today=None):
+    """
+    Create the monthly 'WeatherData' partitions around the current month.
+
+    Partitions are named weatherdata_YYYY_MM. The previous month is included
+    so late observations around midnight on the first still have a home.
+    Existing partitions are left alone.
+
+    Args:
+        conn (psycopg2.connection): Connection object to the PostgreSQL database.
+        months_ahead (int): Number of future months to create partitions for.
+        today (date): Day to start from, today if None.
+
+    Returns:
+        date: First day of the current month, also when the table is not
+        partitioned, None if the partitions could not be created.
+    """
+
+    today = today or date.today()
+    try:
+        if not is_partitioned(conn):
+            print("Table 'WeatherData' is not partitioned, skipping partition creation")
+            sys.stdout.flush()
+            return month_start(today)
+
+        with conn.cursor() as cursor:
+            for offset in range(-1, months_ahead + 1):
+                start = month_start(today, offset)
+                end = month_start(today, offset + 1)
+                cursor.execute(
+                    sql.SQL(
+                        "CREATE TABLE IF NOT EXISTS {} PARTITION OF WeatherData FOR VALUES FROM (%s) TO (%s)"
+                    ).format(sql.Identifier(f"weatherdata_{start:%Y_%m}")),
+                    (start, end)
+                )
+        conn.commit()
+        return month_start(today)
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(f"Error creating partitions: {e}")
+        sys.stdout.flush()
+        return None
@@ -0,0 +1,325 @@
+import sqlite3
+import sys
+import threading
+import time
+
+import psycopg2
+
+from common.extract import dumps, loads
+from weather_writer import WeatherDataWriter
+
+RECONNECT_DELAY = 5
+MAX_RECONNECT_DELAY = 300
+
+class Spool:
+    """
+    Durable local queue of fetched observations.
+
+    Observations are appended to an SQLite file in WAL mode and stay there
+    until they have been written to PostgreSQL, so they survive both a
+    database outage and a restart of the fetcher. Observations that can
+    never be written are moved to the 'quarantine' table, with the error,
+    so they do not hold back the rest of the spool.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Path of the SQLite spool file.
+        """
+
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS observations (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                location_id INTEGER,
+                payload TEXT
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS quarantine (
+                seq INTEGER PRIMARY KEY,
+                location_id INTEGER,
+                payload TEXT,
+                error TEXT,
+                created INTEGER
+            )
+            """
+        )
+        self.conn.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT count(*) FROM observations").fetchone()[0]
+
+    def append(self, observations):
+        """
+        Append observations to the spool in one transaction.
+
+        Args:
+            observations (list): List of (location_id, weather_data) tuples.
+        """
+
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO observations (location_id, payload) VALUES (?, ?)",
+                [(location_id, dumps(weather_data)) for location_id, weather_data in observations]
+            )
+            self.conn.commit()
+
+    def read(self, limit):
+        """
+        Read the oldest observations without removing them.
+
+        Args:
+            limit (int): Maximum number of observations.
+
+        Returns:
+            list: List of (seq, location_id, weather_data) tuples,
+            weather_data is None if the payload cannot be decoded.
+        """
+
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, location_id, payload FROM observations ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+        entries = []
+        for seq, location_id, payload in rows:
+            try:
+                weather_data = loads(payload)
+            except ValueError:
+                weather_data = None
+            entries.append((seq, location_id, weather_data))
+        return entries
+
+    def remove_through(self, seq):
+        """
+        Remove all observations up to and including a sequence number.
+
+        Args:
+            seq (int): Last sequence number to remove.
+        """
+
+        with self.lock:
+            self.conn.execute("DELETE FROM observations WHERE seq <= ?", (seq,))
+            self.conn.commit()
+
+    def quarantine(self, seq, error):
+        """
+        Move one observation to the 'quarantine' table.
+
+        Args:
+            seq (int): Sequence number of the observation.
+            error (str): Why the observation could not be written.
+        """
+
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO quarantine (seq, location_id, payload, error, created)
+                SELECT seq, location_id, payload, ?, ? FROM observations WHERE seq = ?
+                """,
+                (error, int(time.time()), seq)
+            )
+            self.conn.execute("DELETE FROM observations WHERE seq = ?", (seq,))
+            self.conn.commit()
+
+class SpoolWriter:
+    """
+    Writer that appends observations to a spool instead of the database.
+
+    It offers the same add/flush/cycle_stats interface as WeatherDataWriter,
+    the rows are written to PostgreSQL by a SpoolDrainer. Every observation
+    is appended to the spool as soon as it arrives, so nothing is held only
+    in memory.
+    """
+
+    def __init__(self, spool, drainer, batch_size=500):
+        """
+        Args:
+            spool (Spool): Spool to append to.
+            drainer (SpoolDrainer): Drainer writing the spool to the database.
+            batch_size (int): Number of appended observations that wakes the drainer.
+        """
+
+        self.spool = spool
+        self.drainer = drainer
+        self.batch_size = batch_size
+        self.pending = 0
+
+    def add(self, location_id, weather_data):
+        """
+        Append one observation to the spool, waking the drainer once a batch is ready.
+
+        Args:
+            location_id (int): ID of the location.
+            weather_data (dict): Weather data in JSON format.
+        """
+
+        self.spool.append([(location_id, weather_data)])
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Wake the drainer to write what has been appended.
+        """
+
+        if not self.pending:
+            return
+        self.pending = 0
+        self.drainer.wake()
+
+    def cycle_stats(self):
+        """
+        Get the number of new and duplicate rows the drainer wrote since the last call.
+
+        Returns:
+            tuple: (new rows, duplicate rows).
+        """
+
+        return self.drainer.cycle_stats()
+
+class SpoolDrainer(threading.Thread):
+    """
+    Background thread that writes spooled observations to PostgreSQL.
+
+    Observations are written in batches of up to `batch_size` and removed
+    from the spool only after the batch is committed. When the connection is
+    lost, the drainer reconnects with exponential backoff and resumes where
+    it stopped. A batch with invalid rows is written again row by row, and
+    only the rows that are invalid themselves are quarantined. Any other
+    database error keeps the rows spooled and is retried with backoff.
+    """
+
+    def __init__(self, spool, connect, batch_size=500, flush_interval=30, compact=False, latest=None):
+        """
+        Args:
+            spool (Spool): Spool to drain.
+            connect (callable): Function returning a new database connection or None.
+            batch_size (int): Maximum number of rows per transaction.
+            flush_interval (float): Seconds to wait for more rows when the spool is empty.
+            compact (bool): Write the compact row layout.
+            latest (LatestWeatherCache): Cache of the read service to update, if any.
+        """
+
+        super().__init__(name='spool-drainer', daemon=True)
+        self.spool = spool
+        self.connect = connect
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.writer = WeatherDataWriter(None, batch_size, flush_interval, compact, latest)
+        self.stats_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+
+    def wake(self):
+        """
+        Ask the drainer to check the spool right away.
+        """
+
+        self.wakeup.set()
+
+    def stop(self, timeout=None):
+        """
+        Drain what is left in the spool and stop the thread.
+
+        Args:
+            timeout (float): Seconds to wait for the thread to finish.
+        """
+
+        self.stopping.set()
+        self.wakeup.set()
+        self.join(timeout)
+
+    def cycle_stats(self):
+        """
+        Get the number of new and duplicate rows since the last call.
+
+        Returns:
+            tuple: (new rows, duplicate rows).
+        """
+
+        with self.stats_lock:
+            return self.writer.cycle_stats()
+
+    def write_entries(self, entries):
+        """
+        Write spooled observations, quarantining the invalid ones.
+
+        Args:
+            entries (list): List of (seq, location_id, weather_data) tuples.
+
+        Raises:
+            psycopg2.Error: If writing failed for a reason other than invalid rows.
+        """
+
+        observations = []
+        observation_seqs = []
+        for seq, location_id, weather_data in entries:
+            if weather_data is None:
+                self.quarantine(seq, location_id, ValueError("payload is not valid JSON"))
+            else:
+                observations.append((location_id, weather_data))
+                observation_seqs.append(seq)
+
+        def rejected(index, error):
+            self.quarantine(observation_seqs[index], observations[index][0], error)
+
+        with self.stats_lock:
+            self.writer.write(observations, rejected)
+        self.spool.remove_through(entries[-1][0])
+
+    def quarantine(self, seq, location_id, error):
+        print(f"Quarantining spooled observation {seq} of location {location_id}: {error!r}")
+        sys.stdout.flush()
+        self.spool.quarantine(seq, repr(error))
+
+    def run(self):
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                if self.writer.conn is None or self.writer.conn.closed:
+                    self.writer.conn = self.connect()
+                    if self.writer.conn is None:
+                        if self.stopping.wait(delay):
+                            return
+                        delay = min(delay * 2, MAX_RECONNECT_DELAY)
+                        continue
+
+                entries = self.spool.read(self.batch_size)
+                if not entries:
+                    if self.stopping.is_set():
+                        break
+                    self.wakeup.wait(self.flush_interval)
+                    self.wakeup.clear()
+                    continue
+
+                self.write_entries(entries)
+                delay = RECONNECT_DELAY
+            except psycopg2.Error as e:
+                print(f"Error writing to the database, keeping {len(self.spool)} observations spooled, "
+                      f"retrying in {delay}s: {e}")
+                sys.stdout.flush()
+                if self.writer.conn is not None:
+                    self.writer.conn.close()
+                self.writer.conn = None
+                if self.stopping.wait(delay):
+                    break
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            except Exception as e:
+                print(f"Error draining the spool, retrying in {delay}s: {e!r}")
+                sys.stdout.flush()
+                if self.stopping.wait(delay):
+                    break
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+        if self.writer.conn is not None:
+            self.writer.conn.close()
@@ -0,0 +1,114 @@
+import sys
+from array import array
+
+CHECKSUM_QUERY = """
+    SELECT count(*), coalesce(max(stop_id), 0),
+           md5(string_agg(concat_ws(',', stop_id, latitude, longitude, stop_name), ';' ORDER BY stop_id))
+    FROM Locations
+"""
+
+class StopCatalogue:
+    """
+    In-process copy of the bus stops in 'Locations' that can be fetched.
+
+    Stop ids and coordinates are kept in compact arrays, stops with a zero
+    latitude or longitude are left out when loading. The table is re-read
+    only when its checksum (row count, highest stop_id and a hash of the
+    rows) changes.
+    """
+
+    def __init__(self):
+        self.ids = array('i')
+        self.lats = array('d')
+        self.lons = array('d')
+        self.names = []
+        self.checksum = None
+        self._targets = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def refresh(self, conn):
+        """
+        Reload the catalogue if 'Locations' changed since the last load.
+
+        Args:
+            conn (psycopg2.connection): Connection object to the PostgreSQL database.
+
+        Returns:
+            bool: True if the catalogue was reloaded, False otherwise.
+        """
+
+        with conn.cursor() as cursor:
+            cursor.execute(CHECKSUM_QUERY)
+            checksum = cursor.fetchone()
+            if checksum == self.checksum:
+                # End the transaction, an idle one holds back vacuum
+                conn.commit()
+                return False
+
+            cursor.execute(
+                """
+                SELECT stop_id, latitude, longitude, stop_name
+                FROM Locations
+                WHERE latitude <> 0 AND longitude <> 0
+                ORDER BY stop_id
+                """
+            )
+            rows = cursor.fetchall()
+        conn.commit()
+
+        self.ids = array('i', (row[0] for row in rows))
+        self.lats = array('d', (row[1] for row in rows))
+        self.lons = array('d', (row[2] for row in rows))
+        self.names = [row[3] for row in rows]
+        self.checksum = checksum
+        self._targets = {}
+
+        print(f"Loaded {len(rows)} stops, ignoring {checksum[0] - len(rows)} with zero latitude or longitude")
+        sys.stdout.flush()
+        return True
+
+    def stops(self):
+        """
+        Get the stops of the catalogue.
+
+        Returns:
+            list: List of (stop_id, lat, lon, stop_name) tuples.
+        """
+
+        return list(zip(self.ids, self.lats, self.lons, self.names))
+
+    def targets(self, precision=None):
+        """
+        Group the stops into grid cells so each cell is fetched only once.
+
+        A cell is the stop latitude and longitude rounded to `precision`
+        decimal places (2 is roughly a 1 km cell). The API is called with the
+        rounded coordinates and its answer is stored for every stop in the
+        cell. The grouping is cached until the catalogue is reloaded.
+
+        Args:
+            precision (int): Decimal places of the grid, None to fetch every stop.
+
+        Returns:
+            list: List of (stop_ids, lat, lon, name) fetch targets.
+        """
+
+        if precision in self._targets:
+            return self._targets[precision]
+
+        if precision is None:
+            targets = [([stop_id], lat, lon, stop_name) for stop_id, lat, lon, stop_name in self.stops()]
+        else:
+            cells = {}
+            for stop_id, lat, lon in zip(self.ids, self.lats, self.lons):
+                key = (round(lat, precision), round(lon, precision))
+                if key in cells:
+                    cells[key].append(stop_id)
+                else:
+                    cells[key] = [stop_id]
+            targets = [(stop_ids, lat, lon, f"cell {lat}, {lon}") for (lat, lon), stop_ids in cells.items()]
+
+        self._targets[precision] = targets
+        return targets
@@ -0,0 +1,384 @@
+import asyncio
+import json
+import os
+import select
+import sys
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+from urllib.parse import urlsplit, parse_qs
+
+import psycopg2
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from common.extract import WEATHER_FIELDS, FieldExtractor, dumps
+from weather_writer import NOTIFY_CHANNEL, weather_conditions
+
+LATEST_QUERY = "SELECT * FROM WeatherLatest"
+CONDITIONS_QUERY = "SELECT condition_id, main, description FROM weather_conditions"
+
+# Seconds between checks for notifications, and the delay before reconnecting
+LISTEN_TIMEOUT = 5
+RECONNECT_DELAY = 5
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+_extractor = FieldExtractor(WEATHER_FIELDS)
+
+def _condition_json(condition):
+    condition_id, main, description = condition
+    return {'id': condition_id, 'main': main, 'description': description}
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+class LatestWeatherCache:
+    """
+    Latest observation of every stop, kept as ready-to-send JSON.
+
+    Observations are serialised once when they arrive, and the stops of one
+    grid cell share the serialised bytes, so a lookup only copies bytes. An
+    observation replaces the cached one only if it is not older, so late
+    writers cannot roll a stop back. The cache is updated from the fetcher
+    threads and read from the event loop.
+
+    Both storage layouts serve the same JSON: 'weather' is the list of
+    conditions, in compact mode reduced to their id, main and description.
+    """
+
+    def __init__(self, compact=False):
+        """
+        Args:
+            compact (bool): The database uses the compact row layout.
+        """
+
+        self.compact = compact
+        self.lock = threading.Lock()
+        self.observations = {}
+
+    def __len__(self):
+        return len(self.observations)
+
+    def put(self, stop_ids, observation):
+        """
+        Store an observation given as column values for one or more stops.
+
+        Args:
+            stop_ids (list): IDs of the stops sharing the observation.
+            observation (dict): Column name to value, 'dt' in epoch seconds.
+                Observations without 'dt' are ignored.
+        """
+
+        dt = observation.get('dt')
+        if dt is None:
+            return
+        payload = dumps(observation).encode()
+        with self.lock:
+            for stop_id in stop_ids:
+                cached = self.observations.get(stop_id)
+                if cached is None or cached[0] <= dt:
+                    self.observations[stop_id] = (dt, payload)
+
+    def update(self, stop_ids, weather_data):
+        """
+        Store an observation given as an OpenWeatherMap response.
+
+        Args:
+            stop_ids (list): IDs of the stops sharing the observation.
+            weather_data (dict): Weather data in JSON format.
+        """
+
+        observation = dict(zip(_extractor.columns, _extractor(weather_data)))
+        if self.compact:
+            observation['weather'] = [_condition_json(condition) for condition in weather_conditions(weather_data)]
+        self.put(stop_ids, observation)
+
+    def get(self, stop_id):
+        """
+        Get the latest observation of a stop.
+
+        Args:
+            stop_id (int): ID of the stop.
+
+        Returns:
+            bytes: JSON object, None if the stop has no observation.
+        """
+
+        cached = self.observations.get(stop_id)
+        return cached[1] if cached is not None else None
+
+    def get_many(self, stop_ids):
+        """
+        Get the latest observations of many stops.
+
+        Args:
+            stop_ids (list): IDs of the stops.
+
+        Returns:
+            bytes: JSON object keyed by stop id, stops without an
+            observation are left out.
+        """
+
+        observations = self.observations
+        parts = []
+        for stop_id in stop_ids:
+            cached = observations.get(stop_id)
+            if cached is not None:
+                parts.append(b'"%d":%s' % (stop_id, cached[1]))
+        return b'{' + b','.join(parts) + b'}'
+
+    def load(self, conn, stop_ids=None):
+        """
+        Fill the cache from the 'WeatherLatest' table.
+
+        Args:
+            conn (psycopg2.connection): Connection object to the PostgreSQL database.
+            stop_ids (list): IDs of the stops to load, all stops if None.
+
+        Returns:
+            int: Number of stops loaded.
+        """
+
+        with conn.cursor() as cursor:
+            if stop_ids is None:
+                cursor.execute(LATEST_QUERY)
+            else:
+                cursor.execute(LATEST_QUERY + " WHERE location_id = ANY(%s)", (list(stop_ids),))
+            columns = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+            conditions = {}
+            if 'weather_ids' in columns:
+                cursor.execute(CONDITIONS_QUERY)
+                conditions = {condition[0]: condition for condition in cursor.fetchall()}
+        conn.commit()
+
+        location_index = columns.index('location_id')
+        for row in rows:
+            observation = {}
+            for column, value in zip(columns, row):
+                if column in ('weather_id', 'location_id'):
+                    continue
+                if column == 'weather_ids':
+                    # Same shape as the weather JSON of the standard layout
+                    observation['weather'] = [_condition_json(conditions.get(condition_id, (condition_id, None, None)))
+                                              for condition_id in value or []]
+                else:
+                    observation[column] = _json_value(value)
+            self.put([row[location_index]], observation)
+        return len(rows)
+
+class WeatherService:
+    """
+    Minimal asyncio HTTP server answering from a LatestWeatherCache.
+
+    Routes:
+        GET /stops/<id>/latest          latest observation of one stop
+        GET /stops/latest?ids=<id>,...  latest observations of many stops
+    """
+
+    def __init__(self, cache, host='127.0.0.1', port=8080):
+        """
+        Args:
+            cache (LatestWeatherCache): Cache to serve.
+            host (str): Address to listen on.
+            port (int): Port to listen on.
+        """
+
+        self.cache = cache
+        self.host = host
+        self.port = port
+
+    def route(self, target):
+        """
+        Answer one GET request.
+
+        Args:
+            target (str): Request target, path and query string.
+
+        Returns:
+            tuple: (status code, JSON body).
+        """
+
+        parts = urlsplit(target)
+        segments = parts.path.strip('/').split('/')
+        try:
+            if segments == ['stops', 'latest']:
+                ids = parse_qs(parts.query).get('ids', [''])[0]
+                stop_ids = [int(stop_id) for stop_id in ids.split(',') if stop_id]
+                return 200, self.cache.get_many(stop_ids)
+            if len(segments) == 3 and segments[0] == 'stops' and segments[2] == 'latest':
+                observation = self.cache.get(int(segments[1]))
+                if observation is None:
+                    return 404, b'{"error":"no observation for this stop"}'
+                return 200, observation
+        except ValueError:
+            return 400, b'{"error":"stop ids must be integers"}'
+        return 404, b'{"error":"not found"}'
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    status, body = 400, b'{"error":"bad request"}'
+                    method, version = 'GET', 'HTTP/1.0'
+                else:
+                    if method == 'GET':
+                        status, body = self.route(target)
+                    else:
+                        status, body = 405, b'{"error":"only GET is supported"}'
+
+                keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                              or headers.get('connection', '').lower() == 'keep-alive')
+                writer.write(
+                    b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n'
+                    % (status, REASONS[status].encode(), len(body), b'keep-alive' if keep_alive else b'close')
+                )
+                writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """
+        Serve requests until cancelled.
+        """
+
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f"Serving latest weather of {len(self.cache)} stops on {self.host}:{self.port}")
+        sys.stdout.flush()
+        async with server:
+            await server.serve_forever()
+
+    def start_in_thread(self):
+        """
+        Run the server on its own event loop in a daemon thread.
+
+        Returns:
+            threading.Thread: The server thread.
+        """
+
+        thread = threading.Thread(target=asyncio.run, args=(self.serve(),), name='weather-service', daemon=True)
+        thread.start()
+        return thread
+
+def load_config(filename):
+    """
+    Load configuration settings from a JSON file.
+
+    Args:
+        filename (str): The path to the JSON configuration file.
+
+    Returns:
+        dict: Configuration settings.
+    """
+
+    try:
+        with open(filename, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        print(f"Config file '{filename}' not found.")
+        sys.stdout.flush()
+        return None
+
+def connect_to_database(config):
+    """
+    Connect to the PostgreSQL database.
+
+    Args:
+        config (dict): Database connection parameters.
+
+    Returns:
+        psycopg2.connection: Connection object if successful, None otherwise.
+    """
+
+    try:
+        return psycopg2.connect(
+            dbname=config['dbname'],
+            user=config['user'],
+            password=config['password'],
+            host=config['host']
+        )
+    except psycopg2.Error as e:
+        print(f"Error connecting to the database: {e}")
+        sys.stdout.flush()
+        return None
+
+def listen_for_changes(cache, config):
+    """
+    Keep the cache up to date from 'weather_latest' notifications.
+
+    Used when the service runs on its own. The fetcher notifies the ids of
+    the stops whose latest observation changed, and only those rows are
+    read from 'WeatherLatest'. After a reconnect the whole table is read
+    again, since notifications sent meanwhile are lost.
+
+    Args:
+        cache (LatestWeatherCache): Cache to update.
+        config (dict): Database connection parameters.
+    """
+
+    while True:
+        conn = connect_to_database(config)
+        if conn is None:
+            time.sleep(RECONNECT_DELAY)
+            continue
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            cache.load(conn)
+
+            while True:
+                if select.select([conn], [], [], LISTEN_TIMEOUT) == ([], [], []):
+                    continue
+                conn.poll()
+                stop_ids = set()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    stop_ids.update(int(stop_id) for stop_id in notify.payload.split(',') if stop_id)
+                if stop_ids:
+                    cache.load(conn, stop_ids)
+        except psycopg2.Error as e:
+            print(f"Lost connection to the database, reconnecting: {e}")
+            sys.stdout.flush()
+            conn.close()
+            time.sleep(RECONNECT_DELAY)
+
+def main():
+    config = load_config('config.json')
+    if config is None:
+        return
+
+    service_config = config.get('service', {})
+    cache = LatestWeatherCache(config.get('storage') == 'compact')
+    threading.Thread(target=listen_for_changes, args=(cache, config), name='latest-listener', daemon=True).start()
+    service = WeatherService(cache, service_config.get('host', '127.0.0.1'), service_config.get('port', 8080))
+    try:
+        asyncio.run(service.serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
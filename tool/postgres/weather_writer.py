@@ -0,0 +1,348 @@
+import sys
+import time
+from datetime import datetime
+
+import psycopg2
+from psycopg2 import errorcodes
+from psycopg2.extras import execute_values
+
+from common.extract import WEATHER_FIELDS, FieldExtractor, dumps
+
+# Column order of the 'WeatherData' table (see tables.sql), weather_id excluded
+WEATHER_COLUMNS = (
+    'location_id', 'weather', 'main_temp', 'main_feels_like',
+    'main_temp_min', 'main_temp_max', 'main_pressure', 'main_humidity',
+    'main_sea_level', 'main_grnd_level', 'visibility', 'wind_speed',
+    'wind_deg', 'wind_gust', 'clouds_all', 'rain_1h', 'rain_3h',
+    'snow_1h', 'snow_3h', 'dt', 'sys_sunrise', 'sys_sunset', 'timezone'
+)
+
+# Column order of the compact 'WeatherData' table (see tables_compact.sql)
+COMPACT_WEATHER_COLUMNS = ('location_id', 'weather_ids') + WEATHER_COLUMNS[2:]
+
+# Channel notified with the comma separated ids of stops whose latest observation changed
+NOTIFY_CHANNEL = 'weather_latest'
+NOTIFY_CHUNK = 1000
+
+def weather_conditions(weather_data):
+    """
+    Get the weather conditions of an OpenWeatherMap response.
+
+    Args:
+        weather_data (dict): Weather data in JSON format.
+
+    Returns:
+        list: List of (condition_id, main, description) tuples.
+    """
+
+    return [
+        (condition['id'], condition.get('main'), condition.get('description'))
+        for condition in weather_data.get('weather') or []
+        if condition.get('id') is not None
+    ]
+
+def _condition_ids(weather):
+    return [condition['id'] for condition in weather if condition.get('id') is not None]
+
+_TIMESTAMP_CONVERTERS = {
+    'dt': datetime.fromtimestamp,
+    'sys_sunrise': datetime.fromtimestamp,
+    'sys_sunset': datetime.fromtimestamp,
+}
+
+_extractor = FieldExtractor(
+    WEATHER_FIELDS, required=('dt',), converters={**_TIMESTAMP_CONVERTERS, 'weather': dumps}
+)
+_compact_extractor = FieldExtractor(
+    WEATHER_FIELDS, required=('dt',), converters={**_TIMESTAMP_CONVERTERS, 'weather': _condition_ids}
+)
+
+def weather_row(location_id, weather_data, compact=False):
+    """
+    Map an OpenWeatherMap response to a 'WeatherData' row.
+
+    Args:
+        location_id (int): ID of the location.
+        weather_data (dict): Weather data in JSON format.
+        compact (bool): Store condition ids instead of the weather JSON.
+
+    Returns:
+        tuple: Values in the order of WEATHER_COLUMNS, or of
+        COMPACT_WEATHER_COLUMNS if compact.
+
+    Raises:
+        KeyError: If the response has no 'dt'.
+    """
+
+    extractor = _compact_extractor if compact else _extractor
+    return (location_id,) + extractor(weather_data)
+
+def is_data_error(error):
+    """
+    Tell if a database error was caused by the rows themselves.
+
+    Such rows fail again however often they are written. A missing
+    partition is reported as a check violation, but the row is fine once
+    the partition exists.
+
+    Args:
+        error (psycopg2.Error): Error raised while inserting rows.
+
+    Returns:
+        bool: True if the rows are invalid, False if writing may succeed later.
+    """
+
+    return (isinstance(error, (psycopg2.DataError, psycopg2.IntegrityError))
+            and error.pgcode != errorcodes.CHECK_VIOLATION)
+
+def _notify_latest(cursor, location_ids):
+    # NOTIFY payloads are limited to 8000 bytes, so the ids are sent in chunks
+    location_ids = sorted(set(location_ids))
+    for start in range(0, len(location_ids), NOTIFY_CHUNK):
+        chunk = location_ids[start:start + NOTIFY_CHUNK]
+        cursor.execute("SELECT pg_notify(%s, %s)", (NOTIFY_CHANNEL, ','.join(map(str, chunk))))
+
+def insert_weather_rows(conn, rows, compact=False, conditions=()):
+    """
+    Insert many rows into the 'WeatherData' table in a single transaction.
+
+    Rows for a (location_id, dt) pair that is already stored are skipped, so
+    polling faster than the provider updates does not store duplicates.
+    New rows that are newer than the stored latest observation of their stop
+    replace it in 'WeatherLatest' in the same statement, and the ids of
+    those stops are sent on the 'weather_latest' notification channel when
+    the transaction commits.
+
+    Args:
+        conn (psycopg2.connection): Connection object to the PostgreSQL database.
+        rows (list): Rows built by weather_row().
+        compact (bool): Rows use the compact layout.
+        conditions (list): (condition_id, main, description) tuples to add
+            to 'weather_conditions' in the same transaction.
+
+    Returns:
+        int: Number of new rows.
+
+    Raises:
+        psycopg2.Error: If the rows could not be committed, the transaction
+            is rolled back. See is_data_error().
+    """
+
+    if compact:
+        columns = COMPACT_WEATHER_COLUMNS
+        template = "(%s, %s::smallint[]" + ", %s" * (len(columns) - 2) + ")"
+    else:
+        columns = WEATHER_COLUMNS
+        template = "(%s, %s::jsonb" + ", %s" * (len(columns) - 2) + ")"
+
+    try:
+        with conn.cursor() as cursor:
+            if conditions:
+                execute_values(
+                    cursor,
+                    """
+                    INSERT INTO weather_conditions (condition_id, main, description)
+                    VALUES %s ON CONFLICT (condition_id) DO NOTHING
+                    """,
+                    conditions
+                )
+            (inserted, changed), = execute_values(
+                cursor,
+                f"""
+                WITH inserted AS (
+                    INSERT INTO WeatherData ({', '.join(columns)}) VALUES %s
+                    ON CONFLICT DO NOTHING RETURNING *
+                ), latest AS (
+                    INSERT INTO WeatherLatest
+                    SELECT DISTINCT ON (location_id) * FROM inserted
+                    ORDER BY location_id, dt DESC
+                    ON CONFLICT (location_id) DO UPDATE SET
+                        {', '.join(f"{column} = EXCLUDED.{column}" for column in ('weather_id',) + columns[1:])}
+                    WHERE WeatherLatest.dt < EXCLUDED.dt
+                    RETURNING location_id
+                )
+                SELECT (SELECT count(*) FROM inserted), ARRAY(SELECT location_id FROM latest)
+                """,
+                rows,
+                template=template,
+                page_size=len(rows),
+                fetch=True
+            )
+            _notify_latest(cursor, changed)
+        conn.commit()
+        return inserted
+    except psycopg2.Error:
+        if not conn.closed:
+            conn.rollback()
+        raise
+
+class WeatherDataWriter:
+    """
+    Collect weather observations and write them to 'WeatherData' in batches.
+
+    A batch is flushed when it reaches `batch_size` rows or when the oldest
+    buffered row is older than `flush_interval` seconds. Each flush is one
+    multi-row INSERT and one commit. In compact mode, condition ids not seen
+    before are added to 'weather_conditions' with the batch. Invalid
+    observations are skipped without losing the rest of the batch.
+
+    The writer counts new and duplicate rows until cycle_stats() is called.
+    Committed observations are passed on to the `latest` cache, so the read
+    service only serves what is stored.
+    """
+
+    def __init__(self, conn, batch_size=500, flush_interval=30, compact=False, latest=None):
+        """
+        Args:
+            conn (psycopg2.connection): Connection object to the PostgreSQL database.
+            batch_size (int): Number of rows that triggers a flush.
+            flush_interval (float): Maximum age of a buffered row in seconds.
+            compact (bool): Write the compact row layout.
+            latest (LatestWeatherCache): Cache of the read service to update, if any.
+        """
+
+        self.conn = conn
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact = compact
+        self.latest = latest
+        self.observations = []
+        self.first_added = None
+        self.known_conditions = set()
+        self.inserted = 0
+        self.duplicates = 0
+
+    def add(self, location_id, weather_data):
+        """
+        Buffer one observation, flushing if a threshold is reached.
+
+        Args:
+            location_id (int): ID of the location.
+            weather_data (dict): Weather data in JSON format.
+        """
+
+        if not self.observations:
+            self.first_added = time.monotonic()
+        self.observations.append((location_id, weather_data))
+
+        if (len(self.observations) >= self.batch_size
+                or time.monotonic() - self.first_added >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """
+        Write all buffered observations in one transaction.
+
+        Raises:
+            psycopg2.Error: If the connection to the database was lost.
+        """
+
+        if not self.observations:
+            return
+        observations = self.observations
+        self.observations = []
+        self.first_added = None
+        self.write(observations)
+
+    def write(self, observations, rejected=None):
+        """
+        Write observations to 'WeatherData' in one transaction.
+
+        Observations that cannot be mapped to a row are skipped. If the
+        database rejects the batch because of invalid rows, the rows are
+        written one by one, so only the invalid ones are lost.
+
+        Args:
+            observations (list): List of (location_id, weather_data) tuples.
+            rejected (callable): Called with the index of every skipped
+                observation and the error, skipped observations are only
+                logged if None.
+
+        Returns:
+            int: Number of new rows.
+
+        Raises:
+            psycopg2.Error: If writing failed for a reason other than invalid
+                rows, see is_data_error().
+        """
+
+        if rejected is None:
+            def rejected(index, error):
+                print(f"Skipping weather data of location {observations[index][0]}: {error!r}")
+                sys.stdout.flush()
+
+        rows = []
+        indexes = []
+        new_conditions = {}
+        for index, (location_id, weather_data) in enumerate(observations):
+            try:
+                row = weather_row(location_id, weather_data, self.compact)
+                conditions = weather_conditions(weather_data) if self.compact else []
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                rejected(index, e)
+                continue
+            rows.append(row)
+            indexes.append(index)
+            for condition in conditions:
+                if condition[0] not in self.known_conditions:
+                    new_conditions[condition[0]] = condition
+        if not rows:
+            return 0
+
+        conditions = list(new_conditions.values())
+        try:
+            inserted = insert_weather_rows(self.conn, rows, self.compact, conditions)
+            stored = indexes
+        except psycopg2.Error as e:
+            if not is_data_error(e):
+                raise
+            # Find the invalid rows, the others are written one by one
+            inserted = 0
+            stored = []
+            for index, row in zip(indexes, rows):
+                try:
+                    inserted += insert_weather_rows(self.conn, [row], self.compact, conditions)
+                except psycopg2.Error as e:
+                    if not is_data_error(e):
+                        raise
+                    rejected(index, e)
+                else:
+                    stored.append(index)
+
+        print(f"Inserted {inserted} weather data rows, skipped {len(stored) - inserted} duplicates")
+        sys.stdout.flush()
+        self.inserted += inserted
+        self.duplicates += len(stored) - inserted
+        if stored:
+            self.known_conditions.update(new_conditions)
+        if self.latest is not None:
+            self.update_latest([observations[index] for index in stored])
+        return inserted
+
+    def update_latest(self, observations):
+        """
+        Pass committed observations on to the latest weather cache.
+
+        Args:
+            observations (list): List of (location_id, weather_data) tuples,
+                the stops of one grid cell share the weather data object.
+        """
+
+        shared = {}
+        for location_id, weather_data in observations:
+            shared.setdefault(id(weather_data), (weather_data, []))[1].append(location_id)
+        for weather_data, location_ids in shared.values():
+            self.latest.update(location_ids, weather_data)
+
+    def cycle_stats(self):
+        """
+        Get the number of new and duplicate rows since the last call.
+
+        Returns:
+            tuple: (new rows, duplicate rows).
+        """
+
+        stats = (self.inserted, self.duplicates)
+        self.inserted = 0
+        self.duplicates = 0
+        return stats
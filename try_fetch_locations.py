@@ -1,34 +1,40 @@
-import requests
-import csv
+import pandas as pd
 
-def get_coordinates(place_name):
-    url = f"https://nominatim.openstreetmap.org/search?q={place_name}&format=json"
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-        if data:
-            return float(data[0]['lat']), float(data[0]['lon'])
-    return None, None
+from common.centroids import fill_missing_coordinates
+from common.geocoding import Geocoder, place_name
+
+def format_coordinate(value):
+    return f"{value:.6f}".replace('.', ',')
 
 def update_csv(input_file, output_file):
-    with open(input_file, 'r', encoding='utf-8') as f:
-        reader = csv.reader(f, delimiter=';')
-        next(reader)  # Skip header
-        rows = list(reader)
+    # Keep the text of the file as it is, coordinates are parsed separately
+    df = pd.read_csv(input_file, delimiter=';', dtype=str, keep_default_na=False)
+    stops = pd.DataFrame({
+        'lat': pd.to_numeric(df['Zemepisna sirka'].str.replace(',', '.')),
+        'lon': pd.to_numeric(df['Zemepisna dlzka'].str.replace(',', '.')),
+        'town': df['Obec'],
+        'town_part': df['Cast obce']
+    })
+    missing = (stops['lat'] == 0) & (stops['lon'] == 0)  # If lat lon are missing
+
+    # Use the centroid of the town part or town if it has known stops
+    filled = fill_missing_coordinates(stops, 'lat', 'lon', 'town', 'town_part')
+    print(f"Filled coordinates of {filled} stops from town centroids")
 
-    for row in rows:
-        if row[1] == '0' and row[2] == '0':  # If lat lon are missing
-            lat, lon = get_coordinates(row[5] + ", " + row[7].replace(',', '.'))
-            if lat == None: #If precise location cannot be found, skip
-                continue;
-            print(f"Fetched missing coordinates for {row[5]}, {row[7]} - {lat}, {lon}")
-            row[1] = str(lat)
-            row[2] = str(lon)
+    remaining = missing & (stops['lat'] == 0) & (stops['lon'] == 0)
+    places = [place_name(town, stop_name) for town, stop_name in zip(df.loc[remaining, 'Obec'], df.loc[remaining, 'Nazov zastavky'])]
+    coordinates = Geocoder().geocode_many(places)
+    for index, place in zip(df.index[remaining], places):
+        if coordinates[place] is None: #If precise location cannot be found, skip
+            continue
+        lat, lon = coordinates[place]
+        print(f"Fetched missing coordinates for {place} - {lat}, {lon}")
+        stops.loc[index, ['lat', 'lon']] = lat, lon
 
-    with open(output_file, 'w', encoding='utf-8', newline='') as f:
-        writer = csv.writer(f, delimiter=';')
-        writer.writerow(['Cislo zastavky', 'Zemepisna sirka', 'Zemepisna dlzka', 'Stat', 'Okres', 'Obec', 'Cast obce', 'Nazov zastavky'])
-        writer.writerows(rows)
+    resolved = missing & ((stops['lat'] != 0) | (stops['lon'] != 0))
+    df.loc[resolved, 'Zemepisna sirka'] = stops.loc[resolved, 'lat'].map(format_coordinate)
+    df.loc[resolved, 'Zemepisna dlzka'] = stops.loc[resolved, 'lon'].map(format_coordinate)
+    df.to_csv(output_file, sep=';', index=False)
 
 if __name__ == "__main__":
     input_file = "data/stops.csv"